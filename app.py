@@ -0,0 +1,49 @@
+"""
+Export sales from the data warehouse with bounded memory
+
+Usage:
+    python app.py sales 2024-01-01 2024-01-31 --out sales.parquet --columns order_date,product_name,net_amount
+    python app.py summary 2024-01-01 2024-12-31 --by product
+"""
+
+import argparse
+import pyarrow.parquet as pq
+from src.query import WarehouseQuery
+
+
+def export_sales(wq: WarehouseQuery, args):
+    """Stream the sales lines into a Parquet file, one record batch at a time"""
+    columns = args.columns.split(",") if args.columns else None
+    reader = wq.sales_batches(args.start, args.end, columns=columns, product_key=args.product,
+                              employee_key=args.employee, customer_key=args.customer)
+    rows = 0
+    with pq.ParquetWriter(args.out, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    print(f"Exported {rows} rows to {args.out}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the sales data warehouse")
+    parser.add_argument("query", choices=["sales", "summary"])
+    parser.add_argument("start", help="first order date (YYYY-MM-DD)")
+    parser.add_argument("end", help="last order date (YYYY-MM-DD)")
+    parser.add_argument("--by", default="date", choices=list(WarehouseQuery.GROUPINGS))
+    parser.add_argument("--columns", help="comma separated sales columns")
+    parser.add_argument("--product", type=int)
+    parser.add_argument("--employee", type=int)
+    parser.add_argument("--customer", type=int)
+    parser.add_argument("--out", default="sales.parquet")
+    args = parser.parse_args()
+
+    with WarehouseQuery() as wq:
+        if args.query == "sales":
+            export_sales(wq, args)
+        else:
+            print(wq.sales_summary(args.by, args.start, args.end, product_key=args.product,
+                                   employee_key=args.employee, customer_key=args.customer))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,17 @@ from src import config
 from src.etl.extract import SrcChecker,DataExtractor
 from src.etl.transform import DataTransformer
 from src.etl.load_std import DataLoader
+from src.etl.manifest import FileManifest
+from src.etl.watch import SourceWatcher
+from src.etl.profiling import Profiler
+from src.etl.sinks import SinkFanout
+from src.etl.stats import ColumnStats
+from src.etl.dimension_specs import DIMENSION_SPECS, WIDE_SALES_JOINS
+from typing import Dict, Optional
+from datetime import date
 import os
+import time
+import argparse
 import logging
 import polars as pl
 
@@ -16,21 +26,30 @@ class ETLPipeline():
     """
     This class for managing the ETL pipeline
     """
-    def __init__(self):
+    def __init__(self, profile: bool = False):
         self.config =config()
+        # opt-in profiling, every run writes its profiles to a new directory
+        self.profiler = Profiler() if profile or self.config.PROFILE else None
         self.check_src = SrcChecker()
         self.extractor = DataExtractor()
-        self.transformer = DataTransformer()
-        self.loader = DataLoader()
+        self.transformer = DataTransformer(profiler=self.profiler)
+        self.loader = DataLoader(profiler=self.profiler)
+        # statistics of every run are merged with the earlier ones to pick the smallest safe numeric types
+        self.column_stats = ColumnStats() if self.config.COLUMN_STATS else None
+        # the DuckDB warehouse and any other configured sinks, written from the same transformed tables
+        self.sinks = SinkFanout.from_config(self.loader, self.profiler)
 
-    def run_check_src(self,src: list[str]=['csv']) -> bool:
+    def run_check_src(self,src: Optional[list[str]]=None) -> bool:
         """
-        Check if the source CSV files exist
+        Check if the sources exist (CSV files, SQL source tables), defaults to config.SOURCES
         """
         logger.info("Checking source files...")
-        for src_type in src:
+        success = True
+        for src_type in src or self.config.SOURCES:
             if 'csv' in src_type:
-                success = self.check_src.check_src_csv()
+                success = self.check_src.check_src_csv() and success
+            elif 'sql' in src_type:
+                success = self.check_src.check_src_sql() and success
 
         return success
 
@@ -52,6 +71,8 @@ class ETLPipeline():
         raw_data = self.extractor.extract_data()
         if raw_data:
             logger.info("✅ Complete all reading the file.")
+        elif raw_data is not None:
+            logger.info("No new source files since the last run.")
         else:
             logger.error("❌ Extraction failed.")
         return raw_data
@@ -62,24 +83,159 @@ class ETLPipeline():
         logger.info("=" * 50 + "\n")
         
         #transform all data
+        self.load_reference_dimensions()
         transformed_data = self.transformer.transform_all_data(raw_data)
         if not transformed_data:
             logger.error("❌ No data transformed.")
+        return self.apply_column_stats(transformed_data)
+
+    def load_reference_dimensions(self):
+        """
+        Give the wide sales enrichment the dimensions already in the warehouse,
+        an incremental run only rebuilds the dimensions whose sources changed
+        """
+        if not self.config.WIDE_SALES:
+            return
+        # dim_date is generated by the transformer, only the source-built dimensions are read
+        missing = [name for name in WIDE_SALES_JOINS
+                   if name in DIMENSION_SPECS and name not in self.transformer.dimensions]
+        self.transformer.dimensions.update(self.loader.read_tables(missing))
+
+    def apply_column_stats(self, transformed_data: dict) -> dict:
+        """
+        Collect the column statistics of the transformed tables, downcast their numeric
+        columns and hand the matching warehouse types to the loader
+        """
+        if self.column_stats is None or not transformed_data:
+            return transformed_data
+        transformed_data = self.column_stats.apply(transformed_data)
+        self.loader.column_types = {name: self.column_stats.duckdb_types(name) for name in transformed_data}
         return transformed_data
 
     def run_load(self, transformed_data):
-        success =  self.loader.load_all_data(transformed_data)
+        # incremental runs replace the facts of the orders touched by new or changed files
+        success =  self.sinks.write_all(transformed_data, incremental=self.config.INCREMENTAL_EXTRACT,
+                                        fact_keys=self.extractor.fact_keys)
         if success:
+            # only now the files of this run count as ingested
+            self.extractor.commit_manifest()
             logger.info("✅ Data loaded successfully.")
         else:
             logger.error("❌ Loading data failed.")
-        self.loader.disconnect()
+        self.sinks.close()
         return success 
+
+    def run_backfill(self, since: date, until: date) -> bool:
+        """
+        Rebuild one date window of the fact tables (late or corrected transactions).
+        Only the orders of the window and their details are read and transformed, and
+        only that window of the backfill tables is replaced, in every sink.
+
+        Args:
+            since: First order date of the window
+            until: Last order date of the window (inclusive)
+        """
+        logger.info(f"Backfilling {since} - {until}...")
+        # corrected rows can sit in files that were ingested already, so the manifest is not used
+        raw_data = self.extractor.extract_window(
+            lambda schema: self.transformer.orders_window_filter(schema, (since, until))
+        )
+        if not raw_data:
+            logger.error("❌ Extraction failed.")
+            return False
+        self.load_reference_dimensions()
+        transformed_data = self.transformer.transform_all_data(raw_data)
+        # statistics are only collected for the tables that are written
+        window_data = self.apply_column_stats({name: data for name, data in transformed_data.items()
+                                               if name in self.config.BACKFILL_DATE_COLUMNS})
+        success = self.sinks.write_window(window_data, since, until)
+        if success:
+            logger.info("✅ Backfill completed successfully.")
+        else:
+            logger.error("❌ Backfill failed.")
+        self.sinks.close()
+        return success
+
+    # dimension columns stamped with the build time, ignored when comparing two builds
+    DIMENSION_TIMESTAMPS = ["created_at", "updated_at"]
+
+    def run_micro_batch(self, dimensions: Dict[str, pl.DataFrame]) -> bool:
+        """
+        Extract, transform and load the files not ingested yet (one watch micro-batch)
+
+        Args:
+            dimensions: Dimensions loaded by earlier batches, unchanged dimensions are not reloaded
+                (updated once the batch is loaded)
+        Returns:
+            True if the batch was loaded or there was nothing new, False if the load failed
+        """
+        started = time.perf_counter()
+        raw_data = self.extractor.extract_data()
+        if raw_data is None:
+            return False
+        if not raw_data:
+            return True
+        transformed_data = self.apply_column_stats(self.transformer.transform_all_data(raw_data))
+        rebuilt = {}
+        for table_name in [name for name in transformed_data if name.startswith("dim_")]:
+            df = transformed_data[table_name].drop(self.DIMENSION_TIMESTAMPS, strict=False)
+            if table_name in dimensions and dimensions[table_name].equals(df):
+                del transformed_data[table_name]
+            else:
+                rebuilt[table_name] = df
+        if not self.sinks.write_all(transformed_data, incremental=True, fact_keys=self.extractor.fact_keys):
+            return False
+        self.extractor.commit_manifest()
+        dimensions.update(rebuilt)
+        logger.info(f"✅ Micro-batch loaded {len(transformed_data)} tables in {time.perf_counter() - started:.2f}s")
+        return True
+
+    def run_watch(self, max_batches: Optional[int] = None):
+        """
+        Run the pipeline as a daemon: watch the source files and push every
+        micro-batch of new files through transform and an incremental load.
+        Dimensions stay in memory between batches and are only reloaded when they change.
+        The warehouse is only opened during a batch, so it can be queried in between.
+        A failed batch is logged and retried after WATCH_RETRY_SECONDS.
+
+        Args:
+            max_batches: Stop after this many batches, None runs until interrupted
+        """
+        logger.info(f"👀 Watching {self.config.RAW_DATA_PATH} for new source files...")
+        # the manifest is what limits each batch to the files it has not seen yet
+        if self.extractor.manifest is None:
+            self.extractor.manifest = FileManifest()
+        watcher = SourceWatcher()
+        self.load_reference_dimensions()
+        self.sinks.close()
+        dimensions = {}
+        batches = 0
+        retry = False
+        try:
+            while max_batches is None or batches < max_batches:
+                if retry:
+                    time.sleep(self.config.WATCH_RETRY_SECONDS)
+                else:
+                    watcher.wait_for_batch()
+                try:
+                    loaded = self.run_micro_batch(dimensions)
+                except Exception as e:
+                    logger.error(f"Error in micro-batch: {str(e)}")
+                    loaded = False
+                finally:
+                    # release the warehouse write lock between batches
+                    self.sinks.close()
+                if not loaded:
+                    logger.error(f"❌ Micro-batch failed, its files are retried in {self.config.WATCH_RETRY_SECONDS:.0f}s.")
+                retry = not loaded
+                batches += 1
+        except KeyboardInterrupt:
+            logger.info("Stopping watch mode")
+        finally:
+            self.sinks.close()
         
-def main():
-    logger.info('🚀 ❤️ Starting Data Warehouse ETL Pipeline')
-    # Run ETL pipeline
-    pipeline = ETLPipeline()  # Create an instance of the ETLPipeline class
+def run_batch(pipeline: ETLPipeline):
+    """Run the one-shot batch ETL: check sources, extract, transform and load"""
     success = pipeline.run_check_src()
     if success:
         raw_data = pipeline.run_extract_znumunz()
@@ -98,5 +254,35 @@ def main():
         logger.error("❌ Missing source files. Please check the logs for details.")
         return
 
+def main():
+    parser = argparse.ArgumentParser(description="Data Warehouse ETL Pipeline")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and load new source files as micro-batches")
+    parser.add_argument("--profile", action="store_true",
+                        help="write Polars plans, DuckDB profiles and a cProfile of the run to PROFILE_DIR")
+    parser.add_argument("--since", type=date.fromisoformat,
+                        help="backfill: first order date (YYYY-MM-DD) of the window to rebuild")
+    parser.add_argument("--until", type=date.fromisoformat,
+                        help="backfill: last order date (YYYY-MM-DD) of the window to rebuild")
+    args = parser.parse_args()
+    if (args.since is None) != (args.until is None):
+        parser.error("--since and --until must be given together")
+
+    logger.info('🚀 ❤️ Starting Data Warehouse ETL Pipeline')
+    # Run ETL pipeline
+    pipeline = ETLPipeline(profile=args.profile)  # Create an instance of the ETLPipeline class
+    if pipeline.profiler:
+        pipeline.profiler.start()
+    try:
+        if args.watch:
+            pipeline.run_watch()
+        elif args.since is not None:
+            pipeline.run_backfill(args.since, args.until)
+        else:
+            run_batch(pipeline)
+    finally:
+        if pipeline.profiler:
+            pipeline.profiler.stop()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
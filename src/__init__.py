@@ -8,6 +8,7 @@ Modules:
 --------
 - config: Configuration management
 - etl: Extract, Transform, Load pipeline
+- query: Streaming star-schema queries over the warehouse
 - models: Data models and schemas
 
 
@@ -3,6 +3,7 @@ Configuration management for the Data Warehouse project
 """
 
 import os
+import glob
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -23,6 +24,21 @@ class config:
     DATABASE_PATH = os.getenv("DATABASE_PATH", "data_warehouse/sales_dw.duckdb")
     DATABASE_NAME = os.getenv("DATABASE_NAME", "sales_dw.duckdb")
 
+    # Output sinks written concurrently from the same transformed tables: duckdb, parquet, arrow, sqlite
+    SINKS = [sink for sink in os.getenv("SINKS", "duckdb").split(",") if sink]
+    PARQUET_SINK_DIR = os.getenv("PARQUET_SINK_DIR", os.path.join(PROCESSED_DATA_DIR, "parquet"))
+    ARROW_SINK_DIR = os.getenv("ARROW_SINK_DIR", os.path.join(PROCESSED_DATA_DIR, "arrow"))
+    SQLITE_SINK_PATH = os.getenv("SQLITE_SINK_PATH", os.path.join(PROCESSED_DATA_DIR, "sales_mirror.sqlite"))
+    # Rows per write batch of each sink (Parquet row group, Arrow record batch, SQLite executemany)
+    SINK_BATCH_SIZES = {
+        "parquet": int(os.getenv("PARQUET_SINK_BATCH_SIZE", 122880)),
+        "arrow": int(os.getenv("ARROW_SINK_BATCH_SIZE", 65536)),
+        "sqlite": int(os.getenv("SQLITE_SINK_BATCH_SIZE", 10000)),
+    }
+
+    # Query API: rows per streamed Arrow record batch
+    QUERY_BATCH_SIZE = int(os.getenv("QUERY_BATCH_SIZE", 65536))
+
     # # Dashboard configuration
     # DASHBOARD_TITLE = os.getenv("DASHBOARD_TITLE", "Retail Data Warehouse Dashboard")
     # DASHBOARD_PORT = int(os.getenv("DASHBOARD_PORT", 8501))
@@ -31,6 +47,87 @@ class config:
     # ETL configuration
     BATCH_SIZE = int(os.getenv("BATCH_SIZE", 1000))
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    # Build primary keys after the bulk load (false skips them, e.g. for scratch loads)
+    LOAD_BUILD_INDEXES = os.getenv("LOAD_BUILD_INDEXES", "true").lower() == "true"
+
+    # Fact clustering: rows are written ordered by these columns so DuckDB's
+    # min/max zone maps can skip row groups for range filters on the leading key
+    FACT_SALES_CLUSTER_KEYS = [key for key in os.getenv("FACT_SALES_CLUSTER_KEYS", "order_date_key,product_key").split(",") if key]
+    FACT_CLUSTER_KEYS = {
+        "fact_sales": FACT_SALES_CLUSTER_KEYS,
+        "fact_sales_wide": FACT_SALES_CLUSTER_KEYS,
+    }
+    # Tables rewritten by a --since/--until backfill -> their date column
+    BACKFILL_DATE_COLUMNS = {
+        "fact_sales": "order_date_key",
+        "fact_sales_wide": "order_date_key",
+    }
+    # Keyed loads and backfills add their rows at the end of the clustered fact tables, so the zone
+    # maps prune less with every incremental run: a table is rewritten in clustering-key order once
+    # the rows written that way reach this fraction of it (0 never rewrites)
+    RECLUSTER_RATIO = float(os.getenv("RECLUSTER_RATIO", 0.2))
+    # Rows per DuckDB row group (multiple of 2048), 0 keeps DuckDB's default of 122880
+    ROW_GROUP_SIZE = int(os.getenv("ROW_GROUP_SIZE", 0))
+    # Row group pruning report after full fact loads (checkpoints and scans the storage info, off by default)
+    PRUNE_REPORT = os.getenv("PRUNE_REPORT", "false").lower() == "true"
+    # Date-range widths (days) used by the row group pruning report
+    PRUNE_REPORT_WINDOWS_DAYS = [int(days) for days in os.getenv("PRUNE_REPORT_WINDOWS_DAYS", "1,7,30").split(",")]
+
+    # Source types: "csv" reads config.CSV_FILES, "sql" reads the tables of SQL_SOURCE_TABLES
+    # from a relational database (those tables are then not read from CSV)
+    SOURCES = [source for source in os.getenv("SOURCES", "csv").split(",") if source]
+    SQL_SOURCE_DRIVER = os.getenv("SQL_SOURCE_DRIVER", "sqlite")
+    SQL_SOURCE_PATH = os.getenv("SQL_SOURCE_PATH", os.path.join(RAW_DATA_PATH, "oltp.sqlite"))
+    # "source_table=database_table,..." e.g. "transactions=transactions,customers=customers"
+    SQL_SOURCE_TABLES = dict(item.split("=", 1) for item in os.getenv("SQL_SOURCE_TABLES", "").split(",") if item)
+    # "source_table=column,...": incremental pulls of rows with column > last watermark
+    SQL_WATERMARK_COLUMNS = dict(item.split("=", 1) for item in os.getenv("SQL_WATERMARK_COLUMNS", "").split(",") if item)
+    SQL_WATERMARK_PATH = os.getenv("SQL_WATERMARK_PATH", os.path.join(PROCESSED_DATA_DIR, "sql_watermarks.json"))
+    # "source_table=integer column,...": read in SQL_PARTITIONS key ranges on parallel cursors
+    SQL_PARTITION_COLUMNS = dict(item.split("=", 1) for item in os.getenv("SQL_PARTITION_COLUMNS", "").split(",") if item)
+    SQL_PARTITIONS = int(os.getenv("SQL_PARTITIONS", os.cpu_count() or 4))
+    # Rows per cursor fetch (one Arrow record batch)
+    SQL_CHUNK_SIZE = int(os.getenv("SQL_CHUNK_SIZE", 50000))
+
+    # Denormalized fact_sales_wide: fact_sales enriched with dimension attributes during transform
+    # (kept in the DuckDB warehouse only, the other sinks hold the star schema)
+    WIDE_SALES = os.getenv("WIDE_SALES", "false").lower() == "true"
+    # Wide table columns to inline (see dimension_specs.WIDE_SALES_JOINS), empty inlines all of them
+    WIDE_SALES_ATTRIBUTES = [col for col in os.getenv("WIDE_SALES_ATTRIBUTES", "").split(",") if col]
+
+    # Incremental extraction: only files not yet recorded in the manifest are read
+    INCREMENTAL_EXTRACT = os.getenv("INCREMENTAL_EXTRACT", "true").lower() == "true"
+    MANIFEST_PATH = os.getenv("MANIFEST_PATH", os.path.join(PROCESSED_DATA_DIR, "manifest.json"))
+    # Source date columns (as in the CSV headers), read as text and parsed by the transform
+    # in the source format: try_parse_dates would read a file whose days are all <= 12 as d/m/Y
+    SOURCE_DATE_COLUMNS = [col for col in os.getenv("SOURCE_DATE_COLUMNS", "Order Date,Shipped Date").split(",") if col]
+    # Fact source tables -> their order key (standardized column name). When files of these tables
+    # are new or changed, the orders they touch are rebuilt from all rows of every fact source
+    FACT_SOURCE_KEYS = {"orders": "id", "order_details": "order_id"}
+    # Fact tables -> the order key their rows are replaced by on incremental runs
+    FACT_REPLACE_KEYS = {"fact_sales": "order_id", "fact_sales_wide": "order_id"}
+    EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", os.cpu_count() or 4))
+
+    # Partitioned fact build: 0 builds the fact table in one join, N > 0 hash-partitions
+    # the inputs into N slices built on a process pool and written as Parquet shards
+    FACT_PARTITIONS = int(os.getenv("FACT_PARTITIONS", 0))
+    FACT_WORKERS = int(os.getenv("FACT_WORKERS", os.cpu_count() or 4))
+    FACT_SHARD_DIR = os.getenv("FACT_SHARD_DIR", os.path.join(PROCESSED_DATA_DIR, "fact_shards"))
+
+    # Watch mode: poll the source files and run a micro-batch once they stop changing
+    WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", 1))
+    WATCH_DEBOUNCE_SECONDS = float(os.getenv("WATCH_DEBOUNCE_SECONDS", 2))
+    # Delay before a failed micro-batch is retried (its files stay out of the manifest until it succeeds)
+    WATCH_RETRY_SECONDS = float(os.getenv("WATCH_RETRY_SECONDS", 30))
+
+    # Profiling: Polars plans, DuckDB query profiles and a cProfile of the driver per run
+    PROFILE = os.getenv("PROFILE", "false").lower() == "true"
+    PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(PROCESSED_DATA_DIR, "profiles"))
+
+    # Column statistics: min/max, null fraction and distinct count of every transformed column,
+    # used to downcast numeric columns to the smallest safe type
+    COLUMN_STATS = os.getenv("COLUMN_STATS", "true").lower() == "true"
+    STATS_DIR = os.getenv("STATS_DIR", os.path.join(PROCESSED_DATA_DIR, "stats"))
 
     # Date formats
     DATE_FORMAT = os.getenv("DATE_FORMAT", "%Y-%m-%d")
@@ -44,7 +141,8 @@ class config:
     # MAX_MEMORY_GB = int(os.getenv("MAX_MEMORY_GB", 4))
     # THREAD_COUNT = int(os.getenv("THREAD_COUNT", 4))
 
-    # CSV files mapping
+    # CSV files mapping (values may be glob patterns, e.g. "transactions_*.csv*";
+    # .csv.gz and .csv.zst files are decompressed while reading)
     # CSV_FILES = {
     #     "categories":"categories.csv",
     #     "customers":"customers.csv",
@@ -87,6 +185,11 @@ class config:
             raise ValueError(f"Unknown table: {table_name}")
         return os.path.join(cls.RAW_DATA_PATH,cls.CSV_FILES[table_name])
 
+    @classmethod
+    def get_csv_paths(cls, table_name: str) -> list[str]:
+        """Get all files matching the CSV pattern of a table, sorted by path"""
+        return sorted(glob.glob(cls.get_csv_path(table_name)))
+
     @classmethod
     def get_database_path(cls) -> str:
         """Get the full path to the database file"""
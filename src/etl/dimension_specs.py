@@ -0,0 +1,159 @@
+"""
+Declarative specs of the dimension tables
+
+Every spec describes how one source table (a key of config.CSV_FILES) becomes a
+dimension table. DataTransformer compiles all specs into lazy plans that are
+collected together, so adding a dimension only means adding a spec here.
+
+WIDE_SALES_JOINS lists the dimension attributes inlined into the optional
+denormalized fact_sales_wide table.
+
+Spec keys:
+    source:   name of the raw source table
+    columns:  target column -> source column (standardized name), or "*" to keep
+              every source column with only the key renamed
+    key:      target key column (its source column is taken from `columns`,
+              or from `key_source` when columns is "*")
+    derived:  target column -> Polars expression over the source columns
+    dedup:    which row to keep per key: "first" / "last" (source order) or
+              "any" (cheapest, no order guarantee)
+    sort:     sort the result by key (off by default, the loader does not need it)
+"""
+
+import polars as pl
+
+
+def full_name() -> pl.Expr:
+    """`first_name last_name`"""
+    return pl.concat_str([pl.col("first_name"), pl.col("last_name")], separator=" ")
+
+
+DIMENSION_SPECS = {
+    "dim_customers": {
+        "source": "customers",
+        "columns": {
+            "customer_id": "id",
+            "company_name": "company",
+            "first_name": "first_name",
+            "last_name": "last_name",
+            "email_address": "email_address",
+            "job_title": "job_title",
+            "business_phone": "business_phone",
+            "address": "address",
+            "city": "city",
+            "state_province": "state_province",
+            "country_region": "country_region",
+            "postal_code": "zip_postal_code",
+        },
+        "derived": {"full_name": full_name()},
+        "key": "customer_id",
+        "dedup": "first",
+    },
+    "dim_employees": {
+        "source": "employees",
+        "columns": {
+            "employee_key": "id",
+            "company_name": "company",
+            "first_name": "first_name",
+            "last_name": "last_name",
+            "email_address": "email_address",
+            "job_title": "job_title",
+            "business_phone": "business_phone",
+            "city": "city",
+            "state_province": "state_province",
+            "country_region": "country_region",
+        },
+        "derived": {"full_name": full_name()},
+        "key": "employee_key",
+        "dedup": "first",
+    },
+    "dim_products": {
+        "source": "products",
+        "columns": {
+            "product_key": "id",
+            "product_code": "product_code",
+            "product_name": "product_name",
+            "description": "description",
+            "category": "category",
+            "standard_cost": "standard_cost",
+            "list_price": "list_price",
+            "quantity_per_unit": "quantity_per_unit",
+            "reorder_level": "reorder_level",
+            "target_level": "target_level",
+            "minimum_reorder_quantity": "minimum_reorder_quantity",
+        },
+        "derived": {"is_discontinued": pl.col("discontinued").cast(pl.Utf8) == "Yes"},
+        "key": "product_key",
+        "dedup": "first",
+    },
+    "dim_suppliers": {
+        "source": "suppliers",
+        "columns": {
+            "supplier_key": "id",
+            "company_name": "company",
+            "first_name": "first_name",
+            "last_name": "last_name",
+            "email_address": "email_address",
+            "job_title": "job_title",
+            "business_phone": "business_phone",
+            "city": "city",
+            "state_province": "state_province",
+            "country_region": "country_region",
+        },
+        "derived": {"contact_name": full_name()},
+        "key": "supplier_key",
+        "dedup": "first",
+    },
+    "dim_stores": {
+        "source": "stores",
+        "columns": "*",
+        "key": "store_key",
+        "key_source": "id",
+        "dedup": "first",
+    },
+}
+
+
+# dimension -> how fact_sales_wide joins it and which attributes it inlines
+#     fact_key: fact column of the join (the date key is joined on its date)
+#     dim_key:  dimension column of the join
+#     columns:  wide table column -> dimension column (names follow WarehouseQuery.SALES_COLUMNS)
+WIDE_SALES_JOINS = {
+    "dim_date": {
+        "fact_key": "order_date_key",
+        "dim_key": "date_key",
+        "columns": {
+            "year": "year",
+            "quarter": "quarter",
+            "month": "month",
+            "month_name": "month_name",
+            "fiscal_quarter": "fiscal_quarter",
+            "is_weekend": "is_weekend",
+        },
+    },
+    "dim_products": {
+        "fact_key": "product_key",
+        "dim_key": "product_key",
+        "columns": {"product_name": "product_name", "category": "category"},
+    },
+    "dim_customers": {
+        "fact_key": "customer_key",
+        "dim_key": "customer_id",
+        "columns": {
+            "customer_name": "full_name",
+            "company_name": "company_name",
+            "customer_city": "city",
+            "customer_country": "country_region",
+        },
+    },
+    "dim_employees": {
+        "fact_key": "employee_key",
+        "dim_key": "employee_key",
+        "columns": {"employee_name": "full_name"},
+    },
+}
+
+
+def wide_sales_columns(join: dict, attributes: list) -> dict:
+    """Inlined columns of one WIDE_SALES_JOINS entry (`attributes` as config.WIDE_SALES_ATTRIBUTES, empty keeps all)"""
+    return {col: src for col, src in join["columns"].items() if not attributes or col in attributes}
@@ -1,7 +1,11 @@
 import polars as pl
 import os
-from typing import Dict , Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict , List, Optional, Tuple
 from src.config import config
+from src.etl.manifest import FileManifest
+from src.etl.sql_source import SQLSource
 import logging
 
 # Setup logging
@@ -30,8 +34,10 @@ class SrcChecker:
         missing_files = []
 
         for table_name, file_name in self.config.CSV_FILES.items():
+            if "sql" in self.config.SOURCES and table_name in self.config.SQL_SOURCE_TABLES:
+                continue
             file_path = self.config.get_csv_path(table_name)
-        if not os.path.exists(file_path):
+            if not self.config.get_csv_paths(table_name):
                 missing_files.append(file_path)
 
         if missing_files:
@@ -43,6 +49,22 @@ class SrcChecker:
         logger.info("✅ All source files found!")
 
         return True
+
+    def check_src_sql(self) -> bool:
+        """
+        Check if the source database and its configured tables exist
+        Returns:
+        bool: True if all source tables are found, False otherwise
+        """
+        logger.info("Checking source database...")
+        if not self.config.SQL_SOURCE_TABLES:
+            logger.error("No SQL source tables configured (SQL_SOURCE_TABLES)")
+            return False
+        try:
+            return SQLSource().check_tables()
+        except Exception as e:
+            logger.error(f"Error checking SQL source: {e}")
+            return False
      
 class DataExtractor:
     """
@@ -51,33 +73,305 @@ class DataExtractor:
     
     def __init__(self):
         self.config = config()
+        self.manifest = FileManifest() if self.config.INCREMENTAL_EXTRACT else None
+        # files read in this run, recorded in the manifest by `commit_manifest`
+        self.pending_files = {}
+        # order keys whose facts are rebuilt by this run, None when the facts are rebuilt in full
+        self.fact_keys = None
+        # tables read from the relational database instead of CSV
+        self.sql_source = SQLSource() if "sql" in self.config.SOURCES else None
     
+    NULL_VALUES = ["", "NULL", "null", "N/A", "n/a","\\N"]
+    # file suffix -> compression codec (pyarrow name)
+    COMPRESSION_SUFFIXES = {".gz": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+
+    def csv_options(self) -> dict:
+        """
+        Options shared by every CSV read, so all read paths infer the same types
+        (the source date columns stay text, the transform parses them with their exact format)
+        """
+        return {
+            "encoding": "utf8",
+            "try_parse_dates": True,
+            "null_values": self.NULL_VALUES,
+            "schema_overrides": {column: pl.String for column in self.config.SOURCE_DATE_COLUMNS},
+        }
+
+    def detect_compression(self, file_path: str) -> Optional[str]:
+        """
+        Detect the compression of a source file from its suffix
+        Args:
+            file_path (str): path of the file
+        Returns:
+            str: codec name ("gzip" or "zstd"), None for a plain CSV
+        """
+        return self.COMPRESSION_SUFFIXES.get(os.path.splitext(file_path)[1].lower())
+
+    def read_compressed_csv(self, file_path: str, compression: str) -> pl.DataFrame:
+        """
+        อ่านไฟล์ CSV ที่บีบอัด (gzip/zstd) แบบ streaming โดยไม่ต้องแตกไฟล์ลงดิสก์
+        Args:
+            file_path (str): ที่อยู่ของไฟล์ .csv.gz หรือ .csv.zst
+            compression (str): codec ของไฟล์
+        Returns:
+            pl.DataFrame: DataFrame ที่อ่านจากไฟล์
+        """
+        # imported here so plain CSV extraction does not require pyarrow
+        import pyarrow as pa
+
+        # pyarrow decompresses the stream, Polars parses it with the same options as a plain file
+        # (so a compressed file infers the same types: dates, all-empty columns as String)
+        with pa.input_stream(file_path, compression=compression) as stream:
+            return pl.read_csv(stream, **self.csv_options())
+
     def extract_csv(self,file_path: str, table_name: str) -> pl.DataFrame:
         """
         อ่านไฟล์ CSV ไฟล์เดียว และรีเทิร์นค่าเป็น Polars DataFrame
         Args:
-            file_path (str): ที่อยู่ของไฟล์ CSV
+            file_path (str): ที่อยู่ของไฟล์ CSV (.csv, .csv.gz หรือ .csv.zst)
             table_name (str): ชื่อของตารางที่ใช้ในการตั้งชื่อคอลัมน์
         Returns:
             pl.DataFrame: DataFrame ที่อ่านจากไฟล์ CSV
         """
         try:
             logger.info("Starting ETL process...")
-            df = pl.read_csv(file_path,encoding="utf-8",
-                    try_parse_dates=True,
-                    null_values=["", "NULL", "null", "N/A", "n/a","\\N"])
-                # try_parse_dates=True ช่วยให้ Polars พยายามแปลงคอลัมน์ที่เป็นวันที่ให้เป็นชนิดข้อมูล DateTime
+            compression = self.detect_compression(file_path)
+            if compression:
+                df = self.read_compressed_csv(file_path, compression)
+            else:
+                # Polars memory-maps a local file path, so the parser reads the page cache directly
+                df = pl.read_csv(file_path, **self.csv_options())
+                    # try_parse_dates=True ช่วยให้ Polars พยายามแปลงคอลัมน์ที่เป็นวันที่ให้เป็นชนิดข้อมูล DateTime
+                    # ยกเว้นคอลัมน์ใน SOURCE_DATE_COLUMNS ที่อ่านเป็นข้อความ (m/d/Y อาจถูกอ่านเป็น d/m)
             logging.info(f"Successfully extracted {len(df)} rows from {table_name}")
             return df
         except Exception as e:
             logging.error(f"Error reading {file_path}: {e}")
             return None
 
-    def extract_data(self) -> dict:
+    def key_column(self, columns: List[str], key: str) -> str:
+        """
+        Find the raw column whose standardized name is `key`
+        (same rule as DataTransformer.standardize_column_names)
+        """
+        for column in columns:
+            if column.lower().replace(' ', '_').replace('-', '_') == key:
+                return column
+        raise ValueError(f"No column {key} in {', '.join(columns)}")
+
+    def filter_rows(self, frame, key_filter: Optional[Tuple[str, pl.Series]] = None,
+                    row_filter: Optional[Callable[[Dict[str, pl.DataType]], pl.Expr]] = None):
+        """
+        Keep only the rows (of a DataFrame or LazyFrame) whose key is in the given keys
+        and for which the predicate built from the frame's schema holds
+        """
+        if key_filter is not None:
+            key, keys = key_filter
+            column = self.key_column(frame.collect_schema().names(), key)
+            frame = frame.filter(pl.col(column).is_in(keys.implode()))
+        if row_filter is not None:
+            frame = frame.filter(row_filter(dict(frame.collect_schema())))
+        return frame
+
+    def read_fact_files(self, table_name: str, files: Dict[str, dict]) -> Optional[pl.DataFrame]:
+        """
+        Read the new or changed files of a fact source, each one once, and store the distinct
+        order keys of every file in its fingerprint (`commit_manifest` records them)
+        Args:
+            table_name (str): fact source table
+            files (dict): new file path -> fingerprint, as returned by FileManifest.filter_new
+        Returns:
+            pl.DataFrame: the rows of all files, None if a file cannot be read
+        """
+        key = self.config.FACT_SOURCE_KEYS[table_name]
+        with ThreadPoolExecutor(max_workers=self.config.EXTRACT_WORKERS) as pool:
+            frames = list(pool.map(lambda path: self.extract_csv(path, table_name), files))
+        if any(frame is None for frame in frames):
+            return None
+        for fp, frame in zip(files.values(), frames):
+            column = self.key_column(frame.columns, key)
+            fp["keys"] = frame[column].drop_nulls().unique().sort().to_list()
+        logger.info(f"Read {sum(len(frame) for frame in frames)} rows from {len(frames)} new files of {table_name}")
+        return pl.concat(frames, how="diagonal_relaxed")
+
+    def changed_fact_keys(self, new_files: Dict[str, Dict[str, dict]]) -> pl.Series:
+        """
+        Collect the order keys touched by the new or changed files of the fact sources:
+        the keys in their current content (stored by `read_fact_files`) and, for changed
+        files, the keys of the version ingested before (rows removed from a file are
+        removed from the facts too).
+        Args:
+            new_files (dict): table -> new file path -> fingerprint, as returned by FileManifest.filter_new
+        Returns:
+            pl.Series: sorted distinct order keys
+        """
+        keys = set()
+        for table_name, files in new_files.items():
+            if table_name not in self.config.FACT_SOURCE_KEYS:
+                continue
+            for path, fp in files.items():
+                keys.update(self.manifest.files.get(path, {}).get("keys", []))
+                keys.update(fp["keys"])
+        return pl.Series("key", sorted(keys))
+
+    def files_holding_keys(self, file_paths: List[str], keys: set) -> List[str]:
+        """
+        Keep the ingested fact source files whose recorded order keys include one of `keys`,
+        so a keyed rebuild does not scan the whole history (a file recorded without its keys,
+        or changed since it was recorded, is kept)
+        """
+        files = self.manifest.files if self.manifest is not None else {}
+        holding = []
+        for path in file_paths:
+            entry, stat = files.get(path, {}), os.stat(path)
+            unchanged = "keys" in entry and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime
+            if not unchanged or not keys.isdisjoint(entry["keys"]):
+                holding.append(path)
+        return holding
+
+    def pull_sql_changes(self, incremental: bool) -> Tuple[List[str], set, bool]:
+        """
+        Pull the rows past the watermarks of the database tables and decide what is read
+        Args:
+            incremental (bool): pull only past the recorded watermarks (False reads every table in full)
+        Returns:
+            tuple: (tables to read, order keys of the pulled fact source rows,
+                    True when a fact source has no watermark yet and the facts are rebuilt in full)
+        """
+        source = self.sql_source
+        source.pending_watermarks = {}
+        reads, keys, full = [], set(), False
+        for name in source.tables:
+            if name in config.FACT_SOURCE_KEYS:
+                # fact sources are read by key (or in full) once all changes are known
+                reads.append(name)
+            if not (incremental and source.is_incremental(name)):
+                full = full or name in config.FACT_SOURCE_KEYS
+                if name not in reads:
+                    reads.append(name)
+                continue
+            changed = source.read_table(name, incremental=True)
+            if changed is None:
+                logger.info(f"No new rows in {source.tables[name]}")
+            elif name in config.FACT_SOURCE_KEYS:
+                column = self.key_column(changed.columns, config.FACT_SOURCE_KEYS[name])
+                keys.update(changed[column].drop_nulls().to_list())
+            else:
+                # a changed dimension is rebuilt from all of its rows, not only the pulled ones
+                reads.append(name)
+        return reads, keys, full
+
+    def extract_csv_files(self, file_paths: List[str], table_name: str,
+                          key_filter: Optional[Tuple[str, pl.Series]] = None,
+                          row_filter: Optional[Callable[[Dict[str, pl.DataType]], pl.Expr]] = None) -> pl.DataFrame:
+        """
+        Scan several CSV files of one table in parallel into a single DataFrame
+        Args:
+            file_paths (list[str]): paths of the CSV files (plain, gzip or zstd)
+            table_name (str): name of the table the files belong to
+            key_filter (tuple): (standardized key column, keys) to read only the rows of those keys
+            row_filter (callable): schema -> predicate, to read only the rows for which it holds
+        Returns:
+            pl.DataFrame: the rows of all files, columns missing in some files are filled with null
+        """
+        started = time.perf_counter()
+        compressions = {self.detect_compression(path) or "none" for path in file_paths}
+        try:
+            filtered = key_filter is not None or row_filter is not None
+            if len(file_paths) == 1 and not (filtered and compressions == {"none"}):
+                df = self.extract_csv(file_paths[0], table_name)
+                if df is not None:
+                    df = self.filter_rows(df, key_filter, row_filter)
+            elif compressions == {"none"}:
+                scans = [pl.scan_csv(path, **self.csv_options()) for path in file_paths]
+                # Polars scans the files of a lazy concat in parallel
+                lf = pl.concat(scans, how="diagonal_relaxed", parallel=True)
+                # filtered while scanning, only the matching rows are materialized
+                df = self.filter_rows(lf, key_filter, row_filter).collect()
+            else:
+                # compressed files are decompressed on separate threads (pyarrow releases the GIL)
+                with ThreadPoolExecutor(max_workers=self.config.EXTRACT_WORKERS) as pool:
+                    frames = list(pool.map(lambda path: self.extract_csv(path, table_name), file_paths))
+                if any(frame is None for frame in frames):
+                    return None
+                df = self.filter_rows(pl.concat(frames, how="diagonal_relaxed"), key_filter, row_filter)
+        except Exception as e:
+            logging.error(f"Error reading files of {table_name}: {e}")
+            return None
+        if df is None:
+            return None
+
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        size_mb = sum(os.path.getsize(path) for path in file_paths) / (1024 * 1024)
+        logging.info(f"Successfully extracted {len(df)} rows from {len(file_paths)} files of {table_name} "
+                     f"(compression={','.join(sorted(compressions))}, {size_mb:.1f} MB on disk in {elapsed:.2f}s, "
+                     f"{size_mb / elapsed:.1f} MB/s, {len(df) / elapsed:,.0f} rows/s)")
+        return df
+
+    def extract_window(self, orders_filter: Callable[[Dict[str, pl.DataType]], pl.Expr]) -> Optional[dict]:
+        """
+        Read the fact source rows of the orders selected by a predicate (backfill window):
+        the predicate is applied while scanning the orders, and the order details are only
+        read for the keys of those orders. Dimensions are not read, the warehouse has them.
+        Every file is considered, ingested or not (corrected rows can sit in ingested files).
+        Args:
+            orders_filter (callable): schema of the raw orders -> predicate of the orders to read
+        Returns:
+            dict: {"orders": DataFrame, "order_details": DataFrame}, None if a read fails
+        """
+        sql_tables = self.sql_source.tables if self.sql_source is not None else {}
+        try:
+            if "orders" in sql_tables:
+                orders_df = self.sql_source.read_table("orders", incremental=False)
+                if orders_df is not None:
+                    orders_df = self.filter_rows(orders_df, row_filter=orders_filter)
+            else:
+                orders_df = self.extract_csv_files(self.config.get_csv_paths("orders"), "orders",
+                                                   row_filter=orders_filter)
+            if orders_df is None:
+                return None
+            column = self.key_column(orders_df.columns, self.config.FACT_SOURCE_KEYS["orders"])
+            keys = orders_df[column].drop_nulls().unique().sort()
+
+            key = self.config.FACT_SOURCE_KEYS["order_details"]
+            if "order_details" in sql_tables:
+                key_column = self.key_column(self.sql_source.columns("order_details"), key)
+                details_df = self.sql_source.read_table("order_details", incremental=False,
+                                                        key_column=key_column, keys=keys.to_list())
+                if details_df is None:
+                    details_df = self.sql_source.empty_table("order_details")
+            else:
+                file_paths = self.config.get_csv_paths("order_details")
+                # when no file holds an order of the window one is still read (no rows pass) for the columns
+                file_paths = self.files_holding_keys(file_paths, set(keys.to_list())) or file_paths[:1]
+                details_df = self.extract_csv_files(file_paths, "order_details", key_filter=(key, keys))
+            if details_df is None:
+                return None
+        except Exception as e:
+            logger.error(f"Technical error during extracting process: {e}")
+            return None
+        logger.info(f"Read {len(orders_df)} orders of the window and their {len(details_df)} order details")
+        return {"orders": orders_df, "order_details": details_df}
+
+    def commit_manifest(self):
+        """
+        Record the files (and SQL watermarks) read in this run as ingested, call after a successful load
+        """
+        if self.sql_source is not None:
+            self.sql_source.commit_watermarks()
+        if self.manifest is None or not self.pending_files:
+            return
+        for table_name, new_files in self.pending_files.items():
+            self.manifest.mark(table_name, new_files)
+        self.manifest.write()
+        logger.info(f"Recorded {sum(len(f) for f in self.pending_files.values())} files in manifest {self.manifest.manifest_path}")
+        self.pending_files = {}
+
+    def extract_data(self, use_manifest: bool = True) -> dict:
         """
         อ่านข้อมูลจากไฟล์ CSV ทั้งหมดจากโฟลเดอร์ที่ระบุ
         Args:
-            - None:
+            use_manifest (bool): อ่านเฉพาะไฟล์ที่ยังไม่อยู่ใน manifest (False = อ่านทุกไฟล์ เช่นตอน backfill)
         Returns:
             dict: Dictionary ที่มีชื่อตารางเป็น key และ Polars DataFrame เป็น value
             
@@ -87,31 +381,108 @@ class DataExtractor:
             # ตรวจสอบว่าโฟลเดอร์ข้อมูลมีอยู่
             config = self.config
             datasource_dir = config.RAW_DATA_PATH
-            csv_files = config.CSV_FILES
-            if not os.path.isdir(datasource_dir):
+            csv_files = {}
+            if "csv" in config.SOURCES:
+                csv_files = {name: file_name for name, file_name in config.CSV_FILES.items()
+                             if self.sql_source is None or name not in self.sql_source.tables}
+            if csv_files and not os.path.isdir(datasource_dir):
                 logging.info(f"Error: Data folder does not exist '{datasource_dir}'")
                 return None
             # ตรวจสอบว่าไฟล์ CSVs มีอยู่ในโฟลเดอร์ 
             paths = {}   
             for table_name, file_name in csv_files.items():
                 # file_path = os.path.join(datasource_dir, file_name)
-                file_path = config.get_csv_path(table_name)
+                file_paths = config.get_csv_paths(table_name)
                 
-                if os.path.exists(file_path):
-                    paths[table_name] = file_path
+                if file_paths:
+                    paths[table_name] = file_paths
                 else:
                     logger.warning(f"Error: cannot find '{file_name}' in the folder '{datasource_dir}'")
                     return None
+            # ข้ามไฟล์ที่เคยอ่านแล้ว (path, size และ hash ตรงกับใน manifest)
+            self.pending_files = {}
+            self.fact_keys = None
+            # order keys touched by new files or pulled rows; fact_full rebuilds the facts from everything
+            fact_keys, fact_full = set(), False
+            csv_facts = [name for name in paths if name in config.FACT_SOURCE_KEYS]
+            # rows of the new fact source files, read once (their keys are taken from them)
+            new_fact_rows = {}
+            if self.manifest is not None and use_manifest:
+                new_files = {}
+                for name in paths:
+                    new_files[name] = self.manifest.filter_new(name, paths[name])
+                    skipped = len(paths[name]) - len(new_files[name])
+                    if skipped:
+                        logger.info(f"{skipped} files of {name} were already ingested")
+                    if new_files[name]:
+                        self.pending_files[name] = new_files[name]
+                # a changed dimension is rebuilt from all of its files, not only the new ones
+                for name in [name for name in paths if name not in csv_facts and not new_files[name]]:
+                    del paths[name]
+                if any(new_files[name] for name in csv_facts):
+                    for name in [name for name in csv_facts if new_files[name]]:
+                        new_fact_rows[name] = self.read_fact_files(name, new_files[name])
+                        if new_fact_rows[name] is None:
+                            return None
+                    fact_keys.update(self.changed_fact_keys(new_files))
+                    # on the first run every file is new and the facts are built in full
+                    fact_full = not all(self.manifest.has_table(name) for name in csv_facts)
+            elif csv_facts:
+                fact_full = True
+
+            # the watermarks play the part of the manifest for the database tables
+            sql_reads = []
+            if self.sql_source is not None:
+                sql_reads, sql_keys, sql_full = self.pull_sql_changes(use_manifest and config.INCREMENTAL_EXTRACT)
+                fact_keys.update(sql_keys)
+                fact_full = fact_full or sql_full
+
+            sql_facts = [name for name in sql_reads if name in config.FACT_SOURCE_KEYS]
+            if not fact_full and fact_keys:
+                # only the touched orders are rebuilt, from the rows of those orders in every fact source
+                self.fact_keys = pl.Series("key", sorted(fact_keys))
+                logger.info(f"Rebuilding the facts of {len(fact_keys)} orders touched by new or changed rows")
+            elif not fact_full:
+                for name in csv_facts:
+                    del paths[name]
+                sql_reads = [name for name in sql_reads if name not in sql_facts]
+
             dict_df = {}
-            for name, path in paths.items():
-                logger.info(f"Reading the data from {name} at {path}")
-                pl_df = self.extract_csv(path,name)
+            for name, file_paths in paths.items():
+                frames = []
+                if name in new_fact_rows:
+                    # the new files were read above, only the ingested ones are left
+                    frames.append(new_fact_rows[name])
+                    file_paths = [path for path in file_paths if path not in self.pending_files[name]]
+                key_filter = None
+                if self.fact_keys is not None and name in config.FACT_SOURCE_KEYS:
+                    key_filter = (config.FACT_SOURCE_KEYS[name], self.fact_keys)
+                    holding = self.files_holding_keys(file_paths, fact_keys)
+                    # when no file holds a touched key one is still read (no rows pass) for the columns
+                    file_paths = holding if holding or frames else file_paths[:1]
+                if file_paths:
+                    logger.info(f"Reading the data from {name} at {', '.join(file_paths)}")
+                    pl_df = self.extract_csv_files(file_paths,name,key_filter)
+                    if pl_df is None:
+                        return None
+                    frames.append(pl_df)
                 
-                dict_df[name] =  pl_df
+                dict_df[name] = pl.concat(frames, how="diagonal_relaxed") if len(frames) > 1 else frames[0]
                 
                     
             # dict_df = {name: extract_csv(path,name) for name, path in paths.items()}
             logger.info("✅ Completed reading all CSV files.")
+            for name in sql_reads:
+                if self.fact_keys is not None and name in config.FACT_SOURCE_KEYS:
+                    key_column = self.key_column(self.sql_source.columns(name), config.FACT_SOURCE_KEYS[name])
+                    pl_df = self.sql_source.read_table(name, incremental=False, key_column=key_column,
+                                                       keys=self.fact_keys.to_list())
+                else:
+                    pl_df = self.sql_source.read_table(name, incremental=False)
+                if pl_df is None:
+                    logger.info(f"No rows to read from {self.sql_source.tables[name]}")
+                    continue
+                dict_df[name] = pl_df
             return  dict_df
         except Exception as e:
             logger.error(f"Technical error during extracting process: {e}")
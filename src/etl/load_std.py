@@ -1,9 +1,13 @@
 import duckdb as dd
 import polars as pl
-from typing import Dict, List, Optional
+import pyarrow as pa
+from typing import Dict, List, Optional, Tuple, Union
 import logging
+from datetime import date, timedelta
 from pathlib import Path
 from src.config import config
+from src.etl.profiling import Profiler
+from src.etl.dimension_specs import WIDE_SALES_JOINS, wide_sales_columns
 
 # Setup logging
 logging.basicConfig(level=getattr(logging, config.LOG_LEVEL))
@@ -12,10 +16,28 @@ logger = logging.getLogger(__name__)
 class DataLoader:
     """Class for loading data into DuckDB data warehouse"""
     
-    def __init__(self):
+    # Primary keys of the declared tables, added after the bulk insert
+    # (building the index once is much faster than maintaining it row by row)
+    PRIMARY_KEYS = {
+        "dim_date": "date_key",
+        "dim_customers": "customer_id",
+        "dim_products": "product_key",
+        "dim_suppliers": "supplier_key",
+        "dim_employees": "employee_key",
+        "fact_sales": "sale_id",
+        "fact_sales_wide": "sale_id",
+    }
+    
+    # fact table -> rows written out of clustering-key order since its last clustered write
+    CLUSTER_STATE_TABLE = "etl_cluster_state"
+    
+    def __init__(self, profiler: Optional[Profiler] = None):
         self.config = config()
         self.db_path = self.config.DATABASE_PATH
         self.connection = None
+        self.profiler = profiler
+        # table -> column -> smallest safe DuckDB integer type (set from the column statistics)
+        self.column_types = {}
     
     def connect(self) -> dd.DuckDBPyConnection:
         """
@@ -28,11 +50,19 @@ class DataLoader:
             # Ensure database directory exists
             df_path = Path(self.db_path)
             if not df_path.parent.exists():
-                self.db_path.parent.mkdir(parents=True, exist_ok=True)
+                df_path.parent.mkdir(parents=True, exist_ok=True)
             
             
             # Create connection
-            self.connection =dd.connect(self.db_path)
+            if self.config.ROW_GROUP_SIZE > 0:
+                # the row group size is an ATTACH option: attach the warehouse file and make it the default catalog
+                self.connection = dd.connect()
+                self.connection.execute(
+                    f"ATTACH '{self.db_path}' AS warehouse (ROW_GROUP_SIZE {self.config.ROW_GROUP_SIZE})"
+                )
+                self.connection.execute("USE warehouse")
+            else:
+                self.connection =dd.connect(self.db_path)
             logger.info(f"Connected to DuckDB at {self.db_path}")
             return self.connection
             
@@ -40,14 +70,49 @@ class DataLoader:
             logger.error(f"Error connecting to database: {str(e)}")
             raise
     
+    def execute(self, sql: str, name: str):
+        """
+        Execute a load statement (with its DuckDB profile when profiling is enabled)
+        
+        Args:
+            sql: Statement to execute
+            name: Name of the statement, used for the profile file
+        Returns:
+            The rows returned by the statement
+        """
+        if self.profiler is not None:
+            return self.profiler.execute(self.connection, sql, name)
+        return self.connection.execute(sql).fetchall()
+    
+    def read_tables(self, table_names: List[str]) -> Dict[str, pl.DataFrame]:
+        """
+        Read existing warehouse tables into Polars (e.g. the dimensions an incremental run does not rebuild)
+        
+        Returns:
+            Dictionary of table name -> DataFrame, tables that do not exist yet are left out
+        """
+        if not table_names or not Path(self.db_path).exists():
+            return {}
+        if not self.connection:
+            self.connect()
+        return {name: self.connection.execute(f"SELECT * FROM {name}").pl()
+                for name in table_names if self.declared_columns(name)}
+    
     def disconnect(self):
         """Close database connection"""
         if self.connection:
             self.connection.close()
+            # reconnect on the next use (e.g. the next micro-batch of watch mode)
+            self.connection = None
             logger.info("Database connection closed")
     
-    def create_schema(self):
-        """Create database schema for data warehouse"""
+    def create_schema(self, replace: bool = True):
+        """
+        Create database schema for data warehouse
+
+        Args:
+            replace: Recreate existing tables, when False only missing tables are created
+        """
         logger.info("Creating database schema")
         
         if not self.connection:
@@ -59,10 +124,10 @@ class DataLoader:
             # self.connection.execute("CREATE SCHEMA IF NOT EXISTS fact")
             
             # Create dimension tables
-            self.create_dimension_tables()
+            self.create_dimension_tables(replace)
             
             # # Create fact tables
-            self.create_fact_tables()
+            self.create_fact_tables(replace)
             
             logger.info("Database schema created successfully")
             
@@ -70,13 +135,14 @@ class DataLoader:
             logger.error(f"Error creating schema: {str(e)}")
             raise
     
-    def create_dimension_tables(self):
+    def create_dimension_tables(self, replace: bool = True):
         """Create dimension tables"""
+        create = "CREATE OR REPLACE TABLE" if replace else "CREATE TABLE IF NOT EXISTS"
         
         # Date dimension
-        self.connection.execute("""
-            CREATE OR REPLACE TABLE dim_date (
-                date_key DATE PRIMARY KEY,
+        self.connection.execute(f"""
+            {create} dim_date (
+                date_key DATE,
                 date DATE,
                 year INTEGER,
                 quarter INTEGER,
@@ -86,14 +152,15 @@ class DataLoader:
                 day_of_week INTEGER,
                 day_name VARCHAR,
                 week_of_year INTEGER,
-                is_weekend BOOLEAN
+                is_weekend BOOLEAN,
+                fiscal_quarter INTEGER
             )
         """)
         
         # Customer dimension
-        self.connection.execute("""
-            CREATE OR REPLACE TABLE dim_customers (
-                customer_id INTEGER PRIMARY KEY,
+        self.connection.execute(f"""
+            {create} dim_customers (
+                customer_id INTEGER,
                 company_name VARCHAR,
                 first_name VARCHAR,
                 last_name VARCHAR,
@@ -101,18 +168,20 @@ class DataLoader:
                 email_address VARCHAR,
                 job_title VARCHAR,
                 business_phone VARCHAR,
+                address VARCHAR,
                 city VARCHAR,
                 state_province VARCHAR,
                 country_region VARCHAR,
+                postal_code VARCHAR,
                 created_at TIMESTAMP,
                 updated_at TIMESTAMP
             )
         """)
         
         # Product dimension
-        self.connection.execute("""
-            CREATE OR REPLACE TABLE dim_products (
-                product_key INTEGER PRIMARY KEY,
+        self.connection.execute(f"""
+            {create} dim_products (
+                product_key INTEGER,
                 product_code VARCHAR,
                 product_name VARCHAR,
                 description TEXT,
@@ -130,9 +199,9 @@ class DataLoader:
         """)
         
         # Supplier dimension
-        self.connection.execute("""
-            CREATE OR REPLACE TABLE dim_suppliers (
-                supplier_key INTEGER PRIMARY KEY,
+        self.connection.execute(f"""
+            {create} dim_suppliers (
+                supplier_key INTEGER,
                 company_name VARCHAR,
                 first_name VARCHAR,
                 last_name VARCHAR,
@@ -149,9 +218,9 @@ class DataLoader:
         """)
         
         # Employee dimension
-        self.connection.execute("""
-            CREATE OR REPLACE TABLE dim_employees (
-                employee_key INTEGER PRIMARY KEY,
+        self.connection.execute(f"""
+            {create} dim_employees (
+                employee_key INTEGER,
                 company_name VARCHAR,
                 first_name VARCHAR,
                 last_name VARCHAR,
@@ -167,13 +236,14 @@ class DataLoader:
             )
         """)
     
-    def create_fact_tables(self):
+    def create_fact_tables(self, replace: bool = True):
         """Create fact tables"""
+        create = "CREATE OR REPLACE TABLE" if replace else "CREATE TABLE IF NOT EXISTS"
         
         # Sales fact table
-        self.connection.execute("""
-            CREATE OR REPLACE TABLE fact_sales (
-                sale_id INTEGER PRIMARY KEY,
+        self.connection.execute(f"""
+            {create} fact_sales (
+                sale_id INTEGER,
                 order_id INTEGER,
                 customer_key INTEGER,
                 employee_key INTEGER,
@@ -188,9 +258,7 @@ class DataLoader:
                 shipping_fee DECIMAL(10,2),
                 taxes DECIMAL(10,2),
                 order_status_id INTEGER,
-                created_at TIMESTAMP,
-                
-
+                created_at TIMESTAMP
             )
         """)
         # FOREIGN KEY (customer_key) REFERENCES dim_customers(customer_id),
@@ -198,6 +266,12 @@ class DataLoader:
         # FOREIGN KEY (product_key) REFERENCES dim_products(product_key),
         # FOREIGN KEY (order_date_key) REFERENCES dim_date(date_key)
         
+        if self.config.WIDE_SALES:
+            self.create_wide_sales_table(replace)
+        else:
+            # a disabled wide table is no longer maintained, drop it before it goes stale
+            self.connection.execute("DROP TABLE IF EXISTS fact_sales_wide")
+        
         
         # # Purchase fact table
         # self.connection.execute("""
@@ -221,14 +295,390 @@ class DataLoader:
         #     )
         # """)
     
-    def load_dataframe(self, df: pl.DataFrame, table_name: str) -> bool:
+    def wide_sales_select(self) -> str:
+        """
+        Query of fact_sales_wide over the warehouse tables: every column of fact_sales (alias f)
+        plus the dimension attributes selected by config.WIDE_SALES_ATTRIBUTES
+        """
+        select_list, joins = ["f.*"], []
+        for dim_name, join in WIDE_SALES_JOINS.items():
+            columns = wide_sales_columns(join, self.config.WIDE_SALES_ATTRIBUTES)
+            if not columns:
+                continue
+            select_list += [f'{dim_name}."{src}" AS "{col}"' for col, src in columns.items()]
+            joins.append(f"LEFT JOIN {dim_name} ON {dim_name}.{join['dim_key']} = f.{join['fact_key']}")
+        return f"SELECT {', '.join(select_list)} FROM fact_sales f {' '.join(joins)}"
+    
+    def create_wide_sales_table(self, replace: bool = True):
+        """
+        Create fact_sales_wide with the columns of fact_sales and the inlined dimension attributes,
+        each typed like the warehouse column it comes from (DECIMAL amounts as in fact_sales)
+        
+        An existing table with other columns (WIDE_SALES_ATTRIBUTES changed, or the table was just
+        enabled) is recreated and rebuilt from fact_sales and the dimensions in the warehouse.
+        """
+        sql = self.wide_sales_select()
+        columns = [col[0] for col in self.connection.execute(f"{sql} LIMIT 0").description]
+        if not replace and list(self.declared_columns("fact_sales_wide")) == columns:
+            return
+        self.connection.execute(f"CREATE OR REPLACE TABLE fact_sales_wide AS {sql} LIMIT 0")
+        self.record_unclustered_rows("fact_sales_wide", None)
+        if not replace and self.table_has_rows("fact_sales"):
+            row_count = self.load_relation(f"({sql})", "fact_sales_wide", append=True)
+            logger.info(f"Rebuilt fact_sales_wide from the warehouse: {row_count} rows")
+    
+    def refresh_wide_sales(self, dimension_names: List[str]):
+        """
+        Update the attributes fact_sales_wide inlines from reloaded dimensions,
+        only the rows whose attributes changed are rewritten
+        """
+        if not self.config.WIDE_SALES or not self.table_has_rows("fact_sales_wide"):
+            return
+        for dim_name in dimension_names:
+            join = WIDE_SALES_JOINS.get(dim_name)
+            columns = wide_sales_columns(join, self.config.WIDE_SALES_ATTRIBUTES) if join else {}
+            if not columns:
+                continue
+            select_list = ", ".join(f'd."{src}" AS "{col}"' for col, src in columns.items())
+            assignments = ", ".join(f'"{col}" = u."{col}"' for col in columns)
+            changed = " OR ".join(f'fact_sales_wide."{col}" IS DISTINCT FROM u."{col}"' for col in columns)
+            updated = self.execute(f"""
+                UPDATE fact_sales_wide SET {assignments}
+                FROM (SELECT w.sale_id, {select_list} FROM fact_sales_wide w
+                      LEFT JOIN {dim_name} d ON d.{join['dim_key']} = w.{join['fact_key']}) u
+                WHERE fact_sales_wide.sale_id = u.sale_id AND ({changed})
+            """, f"refresh_wide_{dim_name}")[0][0]
+            if updated:
+                logger.info(f"Refreshed the {dim_name} attributes of {updated} fact_sales_wide rows")
+    
+    def table_has_rows(self, table_name: str) -> bool:
+        """Check whether a table exists and already contains rows"""
+        exists = self.connection.execute(
+            "SELECT count(*) FROM information_schema.tables WHERE table_name = ?", [table_name]
+        ).fetchone()[0]
+        if not exists:
+            return False
+        return self.connection.execute(f"SELECT count(*) FROM (SELECT 1 FROM {table_name} LIMIT 1)").fetchone()[0] > 0
+    
+    def declared_columns(self, table_name: str) -> Dict[str, str]:
+        """
+        Get the declared columns of a table
+        
+        Returns:
+            Dictionary of column name -> DuckDB type, empty if the table does not exist
+        """
+        rows = self.connection.execute(
+            "SELECT column_name, data_type FROM information_schema.columns "
+            "WHERE table_name = ? ORDER BY ordinal_position", [table_name]
+        ).fetchall()
+        return dict(rows)
+    
+    def has_primary_key(self, table_name: str) -> bool:
+        """Check whether the primary key of a table was already built"""
+        return self.connection.execute(
+            "SELECT count(*) FROM information_schema.table_constraints "
+            "WHERE table_name = ? AND constraint_type = 'PRIMARY KEY'", [table_name]
+        ).fetchone()[0] > 0
+    
+    def reset_table(self, table_name: str):
+        """
+        Empty a table before a full load
+        
+        An empty copy keeps the declared column types but not the primary key index,
+        so the following bulk insert does not have to maintain it row by row.
+        """
+        self.connection.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM {table_name} LIMIT 0")
+    
+    def apply_column_types(self, table_name: str, declared: Dict[str, str]) -> Dict[str, str]:
+        """
+        Narrow (or widen back) the declared integer columns of a table to the types of self.column_types
+        
+        Primary key columns keep their declared type, their index cannot be altered.
+        
+        Returns:
+            The declared columns after the change
+        """
+        integer_types = ("TINYINT", "SMALLINT", "INTEGER", "BIGINT")
+        key = self.PRIMARY_KEYS.get(table_name)
+        changed = False
+        for col, target in self.column_types.get(table_name, {}).items():
+            if col == key or declared.get(col) not in integer_types or declared[col] == target:
+                continue
+            self.connection.execute(f'ALTER TABLE {table_name} ALTER COLUMN "{col}" TYPE {target}')
+            logger.info(f"{table_name}.{col}: {declared[col]} -> {target}")
+            changed = True
+        return self.declared_columns(table_name) if changed else declared
+    
+    def build_primary_key(self, table_name: str):
+        """Build the primary key (ART index) of a table after its bulk load"""
+        key = self.PRIMARY_KEYS.get(table_name)
+        if key is None or self.has_primary_key(table_name):
+            return
+        self.execute(f"ALTER TABLE {table_name} ADD PRIMARY KEY ({key})", f"index_{table_name}")
+        logger.info(f"Built primary key {table_name}({key})")
+    
+    def insert_lists(self, table_name: str, declared: Dict[str, str],
+                     source_columns: List[str]) -> Tuple[str, str, str]:
+        """
+        Build the column list, the casting select list and the clustering ORDER BY of an insert
+        
+        Returns:
+            (column list, select list, ORDER BY clause or "")
+        """
+        extra_columns = [col for col in source_columns if col not in declared]
+        if extra_columns:
+            logger.warning(f"Columns not declared in {table_name} are not loaded: {', '.join(extra_columns)}")
+        columns = [col for col in declared if col in source_columns]
+        column_list = ", ".join(f'"{col}"' for col in columns)
+        select_list = ", ".join(f'CAST("{col}" AS {declared[col]}) AS "{col}"' for col in columns)
+        
+        # write clustered tables in clustering-key order so every row group covers a narrow key range
+        cluster_keys = [key for key in self.config.FACT_CLUSTER_KEYS.get(table_name, []) if key in columns]
+        order_by = f" ORDER BY {', '.join(cluster_keys)}" if cluster_keys else ""
+        return column_list, select_list, order_by
+    
+    def replace_rows(self, source: str, table_name: str, scope: str) -> Tuple[int, int]:
+        """
+        Replace the rows of a table matching a condition by the rows of a relation
+        (keyed incremental fact loads, date-window backfills), call inside a transaction
+        
+        The rows are staged first. With a primary key, only the rows that are gone are deleted
+        and the others are overwritten with INSERT OR REPLACE: deleting and re-inserting the
+        same keys in one transaction can fail on DuckDB's ART index at commit.
+        
+        Args:
+            source: SQL relation holding the new rows
+            table_name: Name of the target table
+            scope: SQL condition selecting the rows that are replaced
+            
+        Returns:
+            (deleted rows, inserted or replaced rows)
+        """
+        declared = self.declared_columns(table_name)
+        if not declared:
+            # a table without declared schema that does not exist yet: nothing to replace
+            return 0, self.load_relation(source, table_name, append=True, build_indexes=False)
+        declared = self.apply_column_types(table_name, declared)
+        source_columns = [col[0] for col in self.connection.execute(f"SELECT * FROM {source} LIMIT 0").description]
+        column_list, select_list, order_by = self.insert_lists(table_name, declared, source_columns)
+        
+        staging = f"staging_{table_name}"
+        self.connection.execute(f"CREATE OR REPLACE TEMP TABLE {staging} AS SELECT {select_list} FROM {source}")
+        key = self.PRIMARY_KEYS.get(table_name)
+        try:
+            if key is not None and self.has_primary_key(table_name):
+                deleted = self.execute(
+                    f"DELETE FROM {table_name} WHERE ({scope}) AND {key} NOT IN (SELECT {key} FROM {staging})",
+                    f"replace_delete_{table_name}"
+                )[0][0]
+                inserted = self.execute(
+                    f"INSERT OR REPLACE INTO {table_name} ({column_list}) SELECT {column_list} FROM {staging}{order_by}",
+                    f"replace_insert_{table_name}"
+                )[0][0]
+            else:
+                deleted = self.execute(f"DELETE FROM {table_name} WHERE {scope}", f"replace_delete_{table_name}")[0][0]
+                inserted = self.execute(
+                    f"INSERT INTO {table_name} ({column_list}) SELECT {column_list} FROM {staging}{order_by}",
+                    f"replace_insert_{table_name}"
+                )[0][0]
+        finally:
+            self.connection.execute(f"DROP TABLE IF EXISTS {staging}")
+        self.record_unclustered_rows(table_name, inserted)
+        return deleted, inserted
+    
+    def load_relation(self, source: str, table_name: str, append: bool = False, build_indexes: bool = True) -> int:
+        """
+        Bulk-insert a relation into a declared table, casting once into the declared types
+        
+        Args:
+            source: SQL relation to read (registered view or table function)
+            table_name: Name of the target table
+            append: Insert the rows after the existing ones instead of replacing the table
+            build_indexes: Build the primary key after the insert
+            
+        Returns:
+            Number of rows inserted
+        """
+        declared = self.declared_columns(table_name)
+        source_columns = [col[0] for col in self.connection.execute(f"SELECT * FROM {source} LIMIT 0").description]
+        if not declared:
+            # table without declared schema: keep the inferred column types
+            cluster_keys = [key for key in self.config.FACT_CLUSTER_KEYS.get(table_name, []) if key in source_columns]
+            order_by = f" ORDER BY {', '.join(cluster_keys)}" if cluster_keys else ""
+            if append and self.table_has_rows(table_name):
+                return self.execute(f"INSERT INTO {table_name} BY NAME SELECT * FROM {source}{order_by}",
+                                    f"append_{table_name}")[0][0]
+            self.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM {source}{order_by}", f"load_{table_name}")
+            self.record_unclustered_rows(table_name, None)
+            return self.connection.execute(f"SELECT count(*) FROM {table_name}").fetchone()[0]
+        
+        if not append:
+            self.reset_table(table_name)
+        declared = self.apply_column_types(table_name, declared)
+        column_list, select_list, order_by = self.insert_lists(table_name, declared, source_columns)
+        
+        row_count = self.execute(
+            f"INSERT INTO {table_name} ({column_list}) SELECT {select_list} FROM {source}{order_by}",
+            f"{'append' if append else 'load'}_{table_name}"
+        )[0][0]
+        if not append:
+            self.record_unclustered_rows(table_name, None)
+        if build_indexes:
+            self.build_primary_key(table_name)
+        return row_count
+    
+    def unclustered_rows(self, table_name: str) -> int:
+        """Rows of a table written out of clustering-key order since its last clustered write"""
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS {self.CLUSTER_STATE_TABLE} "
+                                f"(table_name VARCHAR, unclustered_rows BIGINT)")
+        row = self.connection.execute(
+            f"SELECT unclustered_rows FROM {self.CLUSTER_STATE_TABLE} WHERE table_name = ?", [table_name]
+        ).fetchone()
+        return row[0] if row else 0
+    
+    def record_unclustered_rows(self, table_name: str, rows: Optional[int]):
         """
-        Load Polars DataFrame into DuckDB table
+        Add rows written out of clustering-key order to the count of a clustered table
+        (keyed loads and backfills add them at the end), None resets it after a clustered write
+        """
+        if not self.config.FACT_CLUSTER_KEYS.get(table_name):
+            return
+        # read first, it also creates the state table
+        previous = self.unclustered_rows(table_name)
+        count = 0 if rows is None else previous + rows
+        self.connection.execute(f"DELETE FROM {self.CLUSTER_STATE_TABLE} WHERE table_name = ?", [table_name])
+        self.connection.execute(f"INSERT INTO {self.CLUSTER_STATE_TABLE} VALUES (?, ?)", [table_name, count])
+    
+    def recluster(self, table_name: str) -> bool:
+        """
+        Rewrite a clustered table in clustering-key order once the rows written out of order
+        reach config.RECLUSTER_RATIO of it, so its row groups cover narrow key ranges again
+        
+        Returns:
+            True if the table was rewritten, False otherwise (the loaded rows are kept either way)
+        """
+        declared = self.declared_columns(table_name)
+        cluster_keys = [key for key in self.config.FACT_CLUSTER_KEYS.get(table_name, []) if key in declared]
+        if not cluster_keys or self.config.RECLUSTER_RATIO <= 0:
+            return False
+        try:
+            unclustered = self.unclustered_rows(table_name)
+            total = self.connection.execute(f"SELECT count(*) FROM {table_name}").fetchone()[0]
+            if not total or unclustered < self.config.RECLUSTER_RATIO * total:
+                return False
+            
+            # the copy keeps the declared column types, the primary key is built again on the sorted rows
+            had_primary_key = self.has_primary_key(table_name)
+            self.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM {table_name} "
+                         f"ORDER BY {', '.join(cluster_keys)}", f"recluster_{table_name}")
+            if had_primary_key:
+                self.build_primary_key(table_name)
+            self.record_unclustered_rows(table_name, None)
+        except Exception as e:
+            logger.error(f"Error rewriting {table_name} in clustering-key order: {str(e)}")
+            return False
+        logger.info(f"Rewrote {table_name} in {', '.join(cluster_keys)} order "
+                    f"({unclustered} of {total} rows were written out of order)")
+        return True
+    
+    def report_row_group_pruning(self, table_name: str) -> Optional[Dict[int, dict]]:
+        """
+        Report how many row groups date-range queries on the leading clustering key can skip
+        
+        For every window width in config.PRUNE_REPORT_WINDOWS_DAYS, the key range of the table is
+        cut into consecutive windows and each window is checked against the min/max zone map of
+        every row group. Rows written by keyed loads and backfills sit at the end of the table and
+        widen the last row groups until `recluster` rewrites it, their count is reported as well.
+        
+        Returns:
+            Dictionary of window days -> {"row_groups", "avg_scanned", "pruned_pct", "unclustered_rows"},
+            None if the table has no date clustering key
+        """
+        cluster_keys = self.config.FACT_CLUSTER_KEYS.get(table_name)
+        if not cluster_keys or not self.declared_columns(table_name).get(cluster_keys[0], "").startswith(("DATE", "TIMESTAMP")):
+            return None
+        key = cluster_keys[0]
+        
+        # zone maps are final once the data is checkpointed
+        self.connection.execute("CHECKPOINT")
+        row_groups = self.connection.execute(f"""
+            SELECT row_group_id,
+                   min(TRY_CAST(regexp_extract(stats, 'Min: ([^,\\]]+)', 1) AS DATE)) AS min_key,
+                   max(TRY_CAST(regexp_extract(stats, 'Max: ([^,\\]]+)', 1) AS DATE)) AS max_key
+            FROM pragma_storage_info('{table_name}')
+            WHERE column_name = '{key}' AND segment_type <> 'VALIDITY'
+            GROUP BY row_group_id
+        """).fetchall()
+        row_groups = [(min_key, max_key) for _, min_key, max_key in row_groups if min_key is not None]
+        if not row_groups:
+            return None
+        
+        first_key = min(min_key for min_key, _ in row_groups)
+        last_key = max(max_key for _, max_key in row_groups)
+        unclustered = self.unclustered_rows(table_name)
+        logger.info(f"{table_name}: {unclustered} rows written out of {key} order since the last clustered write "
+                    f"(rewritten at {self.config.RECLUSTER_RATIO:.0%} of the table)")
+        report = {}
+        for days in self.config.PRUNE_REPORT_WINDOWS_DAYS:
+            window = timedelta(days=days)
+            scanned = []
+            start = first_key
+            while start <= last_key:
+                end = start + window
+                scanned.append(sum(1 for min_key, max_key in row_groups if min_key < end and max_key >= start))
+                start = end
+            avg_scanned = sum(scanned) / len(scanned)
+            report[days] = {
+                "row_groups": len(row_groups),
+                "avg_scanned": round(avg_scanned, 2),
+                "pruned_pct": round(100 * (1 - avg_scanned / len(row_groups)), 1),
+                "unclustered_rows": unclustered,
+            }
+            logger.info(f"{table_name}: {days}-day range on {key} scans {avg_scanned:.1f} of "
+                        f"{len(row_groups)} row groups ({report[days]['pruned_pct']}% pruned)")
+        return report
+    
+    def load_source(self, source: str, table_name: str, replace_keys: Optional[pl.Series] = None,
+                    build_indexes: bool = True) -> str:
+        """
+        Load a relation into a table: replace the whole table, or only the rows of some keys
         
         Args:
-            df: Polars DataFrame to load
+            source: SQL relation to read
             table_name: Name of the target table
-            schema: Database schema (dimension or fact)
+            replace_keys: Keys (column config.FACT_REPLACE_KEYS[table_name]) whose rows are replaced,
+                None replaces the whole table
+            build_indexes: Build the primary key after a full load
+            
+        Returns:
+            Summary of the load for the log
+        """
+        if replace_keys is None:
+            return f"loaded {self.load_relation(source, table_name, append=False, build_indexes=build_indexes)} rows"
+        
+        key = self.config.FACT_REPLACE_KEYS[table_name]
+        self.connection.register("replace_keys", replace_keys.rename("key").to_frame().to_arrow())
+        self.connection.execute("BEGIN TRANSACTION")
+        try:
+            deleted, inserted = self.replace_rows(source, table_name, f"{key} IN (SELECT key FROM replace_keys)")
+            self.connection.execute("COMMIT")
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+        finally:
+            self.connection.unregister("replace_keys")
+        return f"replaced the rows of {len(replace_keys)} {key}s (deleted {deleted}, wrote {inserted} rows)"
+    
+    def load_dataframe(self, df: Union[pl.DataFrame, pa.Table], table_name: str,
+                       replace_keys: Optional[pl.Series] = None, build_indexes: bool = True) -> bool:
+        """
+        Load Polars DataFrame (or Arrow table) into DuckDB table
+        
+        Args:
+            df: Polars DataFrame, or Arrow table (e.g. shared by the output sinks), to load
+            table_name: Name of the target table
+            replace_keys: Replace only the rows of these keys instead of the whole table
+            build_indexes: Build the primary key after the insert
             
         Returns:
             True if successful, False otherwise
@@ -238,42 +688,124 @@ class DataLoader:
                 self.connect()
             
             # Convert Polars DataFrame to Arrow Table for better DuckDB integration
-            arrow_table = df.to_arrow()
+            arrow_table = df if isinstance(df, pa.Table) else df.to_arrow()
             
             # Register the Arrow table with DuckDB
             self.connection.register("temp_table", arrow_table)
             
             # Insert data into target table
-            full_table_name = f"{table_name}"
-            self.connection.execute(f"CREATE OR REPLACE TABLE  {full_table_name} AS SELECT * FROM temp_table")
+            try:
+                summary = self.load_source("temp_table", table_name, replace_keys, build_indexes)
+            finally:
+                # Clean up temporary table
+                self.connection.unregister("temp_table")
             
-            # Clean up temporary table
-            self.connection.unregister("temp_table")
-            
-            logger.info(f"Successfully loaded {len(df)} rows into {full_table_name}")
+            logger.info(f"Successfully {summary} into {table_name}")
             return True
             
         except Exception as e:
             logger.error(f"Error loading data into {table_name}: {str(e)}")
             return False
     
-    def load_all_data(self, transformed_data: Dict[str, pl.DataFrame]) -> bool:
+    def load_parquet_shards(self, shard_glob: str, table_name: str, replace_keys: Optional[pl.Series] = None,
+                            build_indexes: bool = True) -> bool:
+        """
+        Bulk-load Parquet shards into DuckDB table (DuckDB reads the shards in parallel)
+        
+        Args:
+            shard_glob: Glob pattern of the Parquet shards
+            table_name: Name of the target table
+            replace_keys: Replace only the rows of these keys instead of the whole table
+            build_indexes: Build the primary key after the insert
+            
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            if not self.connection:
+                self.connect()
+            
+            summary = self.load_source(f"read_parquet('{shard_glob}')", table_name, replace_keys, build_indexes)
+            logger.info(f"Successfully {summary} from {shard_glob} into {table_name}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error loading shards {shard_glob} into {table_name}: {str(e)}")
+            return False
+    
+    def replace_date_window(self, window_data: Dict[str, Union[pl.DataFrame, pa.Table, str]], since: date,
+                            until: date) -> bool:
+        """
+        Rewrite one date window of the backfill tables in a single transaction:
+        the rebuilt rows are staged and replace the rows of the window (see `replace_rows`)
+        
+        Args:
+            window_data: Table name -> DataFrame, Arrow table (or Parquet shard glob) holding only rows of the window
+            since: First date of the window
+            until: Last date of the window (inclusive)
+            
+        Returns:
+            True if the whole window was replaced, False otherwise (nothing is changed)
+        """
+        if not self.connection:
+            self.connect()
+        
+        # the tables must exist, a backfill never creates the schema from scratch
+        self.create_schema(replace=False)
+        
+        self.connection.execute("BEGIN TRANSACTION")
+        try:
+            for table_name, data in window_data.items():
+                date_column = self.config.BACKFILL_DATE_COLUMNS[table_name]
+                if isinstance(data, str):
+                    source = f"read_parquet('{data}')"
+                else:
+                    self.connection.register("temp_table", data if isinstance(data, pa.Table) else data.to_arrow())
+                    source = "temp_table"
+                try:
+                    deleted, inserted = self.replace_rows(
+                        source, table_name,
+                        f"{date_column} BETWEEN DATE '{since.isoformat()}' AND DATE '{until.isoformat()}'"
+                    )
+                finally:
+                    if source == "temp_table":
+                        self.connection.unregister("temp_table")
+                logger.info(f"Backfill {table_name} {since} - {until}: deleted {deleted}, wrote {inserted} rows")
+            self.connection.execute("COMMIT")
+        except Exception as e:
+            self.connection.execute("ROLLBACK")
+            logger.error(f"Error during backfill {since} - {until}, rolled back: {str(e)}")
+            return False
+        for table_name in window_data:
+            self.recluster(table_name)
+        return True
+    
+    def load_all_data(self, transformed_data: Dict[str, Union[pl.DataFrame, pa.Table, str]], incremental: bool = False,
+                      fact_keys: Optional[pl.Series] = None, build_indexes: Optional[bool] = None) -> bool:
         """
         Load all transformed data into the data warehouse
         
         Args:
-            transformed_data: Dictionary of transformed DataFrames
+            transformed_data: Dictionary of transformed DataFrames (or Arrow tables, or Parquet shard globs)
+            incremental: Keep the existing tables (only the transformed tables are rewritten),
+                dimension tables are always replaced by their latest snapshot
+            fact_keys: Order keys whose fact rows are replaced (incremental runs),
+                None replaces the whole fact tables
+            build_indexes: Build the primary keys after the bulk load,
+                defaults to config.LOAD_BUILD_INDEXES
             
         Returns:
             True if all data loaded successfully, False otherwise
         """
         logger.info("Starting data loading process")
+        if build_indexes is None:
+            build_indexes = self.config.LOAD_BUILD_INDEXES
         
         if not self.connection:
             self.connect()
         
-        # Create schema first
-        self.create_schema()
+        # Create schema first (keep existing tables on incremental runs)
+        self.create_schema(replace=not incremental)
         
         # ตรวจสอบว่าตารางถูกสร้างใน schema จริงหรือไม่
         tables_in_schema = self.connection.sql("SELECT table_name FROM information_schema.tables WHERE table_schema = 'main';")
@@ -287,7 +819,7 @@ class DataLoader:
         dimension_tables = {k: v for k, v in transformed_data.items() if k.startswith("dim_")}
         
         for table_name, df in dimension_tables.items():
-            success = self.load_dataframe(df, table_name)
+            success = self.load_dataframe(df, table_name, build_indexes=build_indexes)
             if success:
                 success_count += 1
         
@@ -295,8 +827,26 @@ class DataLoader:
         fact_tables = {k: v for k, v in transformed_data.items() if k.startswith("fact_")}
         
         for table_name, df in fact_tables.items():
-            if self.load_dataframe(df, table_name):
+            replace_keys = fact_keys if table_name in self.config.FACT_REPLACE_KEYS else None
+            if isinstance(df, str):
+                # fact built in partitions: df is the glob pattern of its Parquet shards
+                loaded = self.load_parquet_shards(df, table_name, replace_keys, build_indexes=build_indexes)
+            else:
+                loaded = self.load_dataframe(df, table_name, replace_keys, build_indexes=build_indexes)
+            if loaded:
                 success_count += 1
+                reclustered = replace_keys is not None and self.recluster(table_name)
+                # the report costs a checkpoint and a storage scan, keyed loads skip it unless the table was rewritten
+                if self.config.PRUNE_REPORT and (replace_keys is None or reclustered):
+                    self.report_row_group_pruning(table_name)
+        
+        # wide rows this run did not rewrite still carry the attributes they were loaded with
+        if not ("fact_sales_wide" in fact_tables and fact_keys is None):
+            try:
+                self.refresh_wide_sales(list(dimension_tables))
+            except Exception as e:
+                logger.error(f"Error refreshing fact_sales_wide attributes: {str(e)}")
+                return False
         
         logger.info(f"Data loading complete: {success_count}/{total_tables} tables loaded successfully")
         return success_count == total_tables
\ No newline at end of file
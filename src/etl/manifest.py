@@ -0,0 +1,123 @@
+"""
+Manifest of source files that have already been ingested
+"""
+
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from src.config import config
+
+# Setup logging
+logging.basicConfig(level=getattr(logging, config.LOG_LEVEL),
+                    format='%(asctime)s - %(levelname)s - %(message)s'
+                    )
+logger = logging.getLogger(__name__)
+
+class FileManifest:
+    """
+    Class for tracking ingested source files by path, size and content hash
+    """
+
+    HASH_CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, manifest_path: str = None):
+        self.config = config()
+        self.manifest_path = manifest_path or self.config.MANIFEST_PATH
+        self.files = self.read()
+
+    def read(self) -> Dict[str, dict]:
+        """
+        Read the manifest from disk
+
+        Returns:
+            dict: file path -> {"table", "size", "mtime", "hash", "ingested_at"}
+            (plus "keys", the order keys of the file, for fact source tables)
+        """
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("files", {})
+        except Exception as e:
+            logger.warning(f"Cannot read manifest {self.manifest_path}, starting empty: {e}")
+            return {}
+
+    def write(self):
+        """Write the manifest to disk (atomically, via a temp file)"""
+        directory = os.path.dirname(self.manifest_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def file_hash(self, file_path: str) -> str:
+        """
+        Compute the content hash of a file in chunks
+        Args:
+            file_path (str): path of the file
+        Returns:
+            str: hex digest of the file content
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def fingerprint(self, file_path: str) -> dict:
+        """Return the size, modification time and content hash of a file"""
+        stat = os.stat(file_path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime, "hash": self.file_hash(file_path)}
+
+    def has_table(self, table_name: str) -> bool:
+        """Check whether files of a table were ingested before"""
+        return any(entry.get("table") == table_name for entry in self.files.values())
+
+    def filter_new(self, table_name: str, paths: List[str]) -> Dict[str, dict]:
+        """
+        Keep only the files that are not in the manifest or whose content changed
+        Args:
+            table_name (str): table the files belong to
+            paths (list[str]): candidate file paths
+        Returns:
+            dict: new file path -> fingerprint, ready to be passed to `mark`
+        """
+        candidates = []
+        for path in paths:
+            seen = self.files.get(path)
+            stat = os.stat(path)
+            if seen is None or seen.get("table") != table_name or seen.get("size") != stat.st_size:
+                # a file with a different size is new for sure, skip hashing it twice
+                candidates.append((path, None))
+            elif seen.get("mtime") != stat.st_mtime:
+                candidates.append((path, seen))
+            # same size and modification time: unchanged, not read again
+
+        with ThreadPoolExecutor(max_workers=self.config.EXTRACT_WORKERS) as pool:
+            fingerprints = list(pool.map(lambda item: self.fingerprint(item[0]), candidates))
+
+        new_files = {}
+        for (path, seen), fp in zip(candidates, fingerprints):
+            if seen is None or seen.get("hash") != fp["hash"]:
+                new_files[path] = fp
+            else:
+                # touched but not changed: remember the new mtime so it is not hashed again
+                seen["mtime"] = fp["mtime"]
+        return new_files
+
+    def mark(self, table_name: str, new_files: Dict[str, dict]):
+        """
+        Record files as ingested (call `write` to persist)
+        Args:
+            table_name (str): table the files belong to
+            new_files (dict): file path -> fingerprint, as returned by `filter_new`
+        """
+        ingested_at = datetime.now().isoformat(timespec="seconds")
+        for path, fp in new_files.items():
+            self.files[path] = {"table": table_name, **fp, "ingested_at": ingested_at}
@@ -0,0 +1,177 @@
+"""
+Opt-in profiling of a pipeline run (Polars plans, DuckDB query profiles, cProfile of the driver)
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import pstats
+import cProfile
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List
+import polars as pl
+from src.config import config
+
+# Setup logging
+logging.basicConfig(level=getattr(logging, config.LOG_LEVEL),
+                    format='%(asctime)s - %(levelname)s - %(message)s'
+                    )
+logger = logging.getLogger(__name__)
+
+class Profiler:
+    """
+    Class for collecting the profiles of one pipeline run into its own directory
+        - polars_<name>_plan.txt / polars_<name>_timings.csv for each transform
+        - duckdb_<name>.json for each load statement
+        - driver.prof / driver_top.txt for the Python driver and its sink threads
+        - summary.json with the wall time of every profiled step
+    """
+
+    def __init__(self, profile_dir: str = None, run_dir: str = None):
+        """
+        Args:
+            profile_dir: Directory holding one directory per run, defaults to config.PROFILE_DIR
+            run_dir: Write into an existing run directory (e.g. from a worker process of the run)
+        """
+        self.config = config()
+        run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.run_dir = run_dir or os.path.join(profile_dir or self.config.PROFILE_DIR, run_id)
+        os.makedirs(self.run_dir, exist_ok=True)
+        self.driver_profile = cProfile.Profile()
+        # profiles of the worker threads (see `profile_thread`), merged into driver.prof
+        self.thread_profiles: List[cProfile.Profile] = []
+        self.lock = threading.Lock()
+        self.timings = {}
+
+    def path(self, file_name: str) -> str:
+        """Return the path of a file in the run directory, with a file-system safe name"""
+        return os.path.join(self.run_dir, re.sub(r"[^A-Za-z0-9_.-]+", "_", file_name))
+
+    def start(self):
+        """Start the cProfile profile of the Python driver"""
+        logger.info(f"Profiling enabled, writing profiles to {self.run_dir}")
+        self.driver_profile.enable()
+
+    def stop(self):
+        """Stop the driver profile and write it, merged with the thread profiles, together with the summary"""
+        self.driver_profile.disable()
+        with open(self.path("driver_top.txt"), "w", encoding="utf-8") as f:
+            stats = pstats.Stats(self.driver_profile, stream=f)
+            with self.lock:
+                for profile in self.thread_profiles:
+                    stats.add(profile)
+            stats.dump_stats(self.path("driver.prof"))
+            stats.sort_stats("cumulative").print_stats(50)
+        with open(self.path("summary.json"), "w", encoding="utf-8") as f:
+            json.dump(self.timings, f, indent=2)
+        logger.info(f"Profiles written to {self.run_dir}")
+
+    def profile_thread(self, function: Callable, name: str) -> Callable:
+        """
+        Wrap a function that runs on a worker thread so its calls are profiled as well
+
+        Before Python 3.12 cProfile only sees the thread that enabled it, the wrapper profiles
+        each call on its own thread and `stop` merges it into driver.prof. From 3.12 the
+        driver profile already covers every thread (and a second one cannot be enabled).
+
+        Args:
+            function: Function run on the worker thread
+            name: Name of the work (its wall time is added to the summary)
+        Returns:
+            The wrapped function
+        """
+        def profiled(*args, **kwargs):
+            profile = cProfile.Profile() if sys.version_info < (3, 12) else None
+            started = time.perf_counter()
+            if profile is not None:
+                profile.enable()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                if profile is not None:
+                    profile.disable()
+                with self.lock:
+                    if profile is not None:
+                        self.thread_profiles.append(profile)
+                    self.timings[name] = self.timings.get(name, 0) + time.perf_counter() - started
+        return profiled
+
+    def collect(self, lf: pl.LazyFrame, name: str) -> pl.DataFrame:
+        """
+        Collect a LazyFrame while recording its optimized plan and node timings
+
+        Args:
+            lf: LazyFrame of a transform
+            name: Name of the transform (used in the file names)
+        Returns:
+            The collected DataFrame
+        """
+        with open(self.path(f"polars_{name}_plan.txt"), "w", encoding="utf-8") as f:
+            f.write(lf.explain(optimized=True))
+
+        started = time.perf_counter()
+        if hasattr(lf, "profile"):
+            df, node_timings = lf.profile()
+            node_timings.write_csv(self.path(f"polars_{name}_timings.csv"))
+        else:
+            # Polars >= 2.0 has no per-node timings, only the plan and the total time are recorded
+            df = lf.collect()
+        self.timings[f"polars_{name}"] = time.perf_counter() - started
+        return df
+
+    def collect_all(self, plans: Dict[str, pl.LazyFrame]) -> Dict[str, pl.DataFrame]:
+        """
+        Collect several LazyFrames together while recording their optimized plans
+
+        Args:
+            plans: Dictionary of name -> LazyFrame
+        Returns:
+            Dictionary of name -> collected DataFrame
+        """
+        for name, lf in plans.items():
+            with open(self.path(f"polars_{name}_plan.txt"), "w", encoding="utf-8") as f:
+                f.write(lf.explain(optimized=True))
+        started = time.perf_counter()
+        frames = dict(zip(plans, pl.collect_all(list(plans.values()))))
+        self.timings[f"polars_{'+'.join(plans)}"] = time.perf_counter() - started
+        return frames
+
+    def sink_parquet(self, lf: pl.LazyFrame, path: str, name: str):
+        """
+        Stream a LazyFrame into a Parquet file while recording its optimized plan and wall time
+
+        Args:
+            lf: LazyFrame of a transform
+            path: Parquet file to write
+            name: Name of the transform (used in the file names)
+        """
+        with open(self.path(f"polars_{name}_plan.txt"), "w", encoding="utf-8") as f:
+            f.write(lf.explain(optimized=True))
+        started = time.perf_counter()
+        lf.sink_parquet(path)
+        self.timings[f"polars_{name}"] = time.perf_counter() - started
+
+    def execute(self, connection, sql: str, name: str):
+        """
+        Execute a DuckDB statement with its query profile written to the run directory
+
+        Args:
+            connection: DuckDB connection
+            sql: Statement to execute
+            name: Name of the statement (used in the file name)
+        Returns:
+            The rows returned by the statement
+        """
+        connection.execute("PRAGMA enable_profiling='json'")
+        connection.execute(f"SET profiling_output='{self.path(f'duckdb_{name}.json')}'")
+        started = time.perf_counter()
+        try:
+            # fetch before the profiling is switched off, that statement would replace the result
+            return connection.execute(sql).fetchall()
+        finally:
+            self.timings[f"duckdb_{name}"] = time.perf_counter() - started
+            connection.execute("PRAGMA disable_profiling")
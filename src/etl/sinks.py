@@ -0,0 +1,430 @@
+"""
+Output sinks: write the same transformed tables to several destinations at once
+"""
+
+import os
+import glob
+import sqlite3
+import logging
+from abc import ABC, abstractmethod
+from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Union
+import polars as pl
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+from src.config import config
+from src.etl.load_std import DataLoader
+from src.etl.profiling import Profiler
+
+# Setup logging
+logging.basicConfig(level=getattr(logging, config.LOG_LEVEL),
+                    format='%(asctime)s - %(levelname)s - %(message)s'
+                    )
+logger = logging.getLogger(__name__)
+
+class Sink(ABC):
+    """
+    Base class of an output sink
+
+    A sink receives every transformed table as an Arrow table shared by all sinks
+    and writes it in batches of its own size. Dimension tables replace the previous
+    snapshot. On incremental runs the fact rows of the rebuilt order keys replace the
+    earlier rows of those keys, so writing the same batch twice does not duplicate rows.
+    """
+
+    name = "sink"
+
+    # tables kept by the warehouse only: fact_sales_wide is refreshed in place when a
+    # dimension changes (DataLoader.refresh_wide_sales), a copy in another sink would go stale
+    WAREHOUSE_TABLES = ("fact_sales_wide",)
+
+    def __init__(self, batch_size: Optional[int] = None):
+        self.config = config()
+        self.batch_size = batch_size or self.config.SINK_BATCH_SIZES.get(self.name, self.config.BATCH_SIZE)
+
+    def write_table(self, table_name: str, table: pa.Table, replace_keys: Optional[pa.Array]):
+        """
+        Write one table, implemented by the sinks written table by table (used by `write_all`)
+
+        Args:
+            table_name: Name of the table
+            table: Rows to write
+            replace_keys: Keys (column config.FACT_REPLACE_KEYS[table_name]) whose earlier rows are
+                replaced by the rows of `table`, None replaces the whole table
+        """
+        raise NotImplementedError(f"{self.name} sink cannot write a single table")
+
+    def key_mask(self, column: pa.ChunkedArray, keys: pa.Array) -> pa.ChunkedArray:
+        """Mask of the rows whose key is one of `keys` (the column may be downcast, compare as keys' type)"""
+        return pc.is_in(pc.cast(column, keys.type), value_set=keys)
+
+    def write_all(self, transformed_data: Dict[str, Union[pl.DataFrame, str]],
+                  arrow_tables: Dict[str, pa.Table], incremental: bool = False,
+                  fact_keys: Optional[pl.Series] = None) -> bool:
+        """
+        Write all tables (dimensions first, then facts)
+
+        Args:
+            incremental: Keep the tables that are not written by this run
+            fact_keys: Order keys whose fact rows are replaced, None replaces the whole fact tables
+
+        Returns:
+            True if all tables were written, False otherwise
+        """
+        success = True
+        keys = fact_keys.to_arrow() if fact_keys is not None else None
+        for table_name in sorted(arrow_tables, key=lambda name: not name.startswith("dim_")):
+            if table_name in self.WAREHOUSE_TABLES:
+                continue
+            replace_keys = keys if table_name in self.config.FACT_REPLACE_KEYS else None
+            try:
+                self.write_table(table_name, arrow_tables[table_name], replace_keys)
+                logger.info(f"[{self.name}] wrote {arrow_tables[table_name].num_rows} rows to {table_name}")
+            except Exception as e:
+                logger.error(f"[{self.name}] error writing {table_name}: {e}")
+                success = False
+        return success
+
+    def replace_window(self, table_name: str, table: pa.Table, since: date, until: date):
+        """
+        Replace the rows of one date window of a table (column config.BACKFILL_DATE_COLUMNS[table_name],
+        both ends inclusive) by the rows of `table`, implemented by the sinks written table by table
+        """
+        raise NotImplementedError(f"{self.name} sink cannot replace a date window")
+
+    def write_window(self, arrow_tables: Dict[str, pa.Table], since: date, until: date) -> bool:
+        """
+        Replace one date window of the backfill tables
+
+        Returns:
+            True if the window of every table was replaced, False otherwise
+        """
+        success = True
+        for table_name, table in arrow_tables.items():
+            if table_name in self.WAREHOUSE_TABLES:
+                continue
+            try:
+                self.replace_window(table_name, table, since, until)
+                logger.info(f"[{self.name}] replaced {since} - {until} of {table_name} with {table.num_rows} rows")
+            except Exception as e:
+                logger.error(f"[{self.name}] error replacing {since} - {until} of {table_name}: {e}")
+                success = False
+        return success
+
+    def close(self):
+        """Release the resources of the sink"""
+
+class DuckDBSink(Sink):
+    """
+    Sink writing into the DuckDB warehouse through DataLoader (typed DDL, primary keys, clustering)
+
+    The loader reads the shared Arrow tables (DuckDB scans them in place), not the transformed frames.
+    """
+
+    name = "duckdb"
+
+    def __init__(self, loader: Optional[DataLoader] = None, batch_size: Optional[int] = None):
+        super().__init__(batch_size)
+        self.loader = loader or DataLoader()
+
+    def write_all(self, transformed_data, arrow_tables, incremental: bool = False, fact_keys=None) -> bool:
+        # the whole load goes through the loader: schema, dimensions before facts, wide table refresh
+        return self.loader.load_all_data(arrow_tables, incremental=incremental, fact_keys=fact_keys)
+
+    def write_window(self, arrow_tables: Dict[str, pa.Table], since: date, until: date) -> bool:
+        # every table of the window in one transaction
+        return self.loader.replace_date_window(arrow_tables, since, until)
+
+    def close(self):
+        self.loader.disconnect()
+
+class FileSink(Sink):
+    """
+    Base class of the sinks writing one directory of part files per table
+
+    Replacing the rows of some keys rewrites only the parts that hold one of those keys.
+    Parts are written with 64-bit numeric columns, so every part of a table has the same schema.
+    """
+
+    extension = ""
+
+    def __init__(self, output_dir: str, batch_size: Optional[int] = None):
+        super().__init__(batch_size)
+        self.output_dir = output_dir
+
+    @abstractmethod
+    def read_part(self, path: str, columns: Optional[List[str]] = None) -> pa.Table:
+        """Read a part file, implemented by each sink"""
+
+    @abstractmethod
+    def write_part(self, path: str, table: pa.Table):
+        """Write a part file, implemented by each sink"""
+
+    def stable_table(self, table: pa.Table) -> pa.Table:
+        """
+        Widen the numeric columns downcast by ColumnStats back to 64 bits
+
+        The smallest safe type follows the merged history and changes between runs, while
+        the part files of a table directory must share one schema to be read as a dataset.
+        """
+        schema = pa.schema([
+            field.with_type(pa.int64()) if pa.types.is_signed_integer(field.type)
+            else field.with_type(pa.float64()) if pa.types.is_floating(field.type)
+            else field
+            for field in table.schema
+        ])
+        return table if schema.equals(table.schema) else table.cast(schema)
+
+    def remove_rows(self, table_dir: str, column: str, mask: Callable[[pa.ChunkedArray], pa.ChunkedArray]):
+        """Remove the rows selected by a mask of one column from the existing parts of a table"""
+        for part in glob.glob(os.path.join(table_dir, f"*{self.extension}")):
+            if not pc.any(mask(self.read_part(part, [column])[column])).as_py():
+                continue
+            table = self.read_part(part)
+            kept = table.filter(pc.invert(mask(table[column])))
+            if kept.num_rows:
+                # write next to the part and swap, a failure never leaves a half-written part
+                self.write_part(f"{part}.tmp", kept)
+                os.replace(f"{part}.tmp", part)
+            else:
+                os.remove(part)
+
+    def window_mask(self, column: pa.ChunkedArray, since: date, until: date) -> pa.ChunkedArray:
+        """Mask of the rows whose date (or timestamp) is in the window (rows without a date are not in it)"""
+        start = datetime.combine(since, datetime.min.time())
+        end = datetime.combine(until + timedelta(days=1), datetime.min.time())
+        if not pa.types.is_timestamp(column.type):
+            start, end = start.date(), end.date()
+        in_window = pc.and_(pc.greater_equal(column, pa.scalar(start, column.type)),
+                            pc.less(column, pa.scalar(end, column.type)))
+        return pc.fill_null(in_window, False)
+
+    def write_new_part(self, table_dir: str, table: pa.Table):
+        """Add a part file to the directory of a table"""
+        self.write_part(os.path.join(table_dir, f"part-{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}{self.extension}"),
+                        self.stable_table(table))
+
+    def write_table(self, table_name: str, table: pa.Table, replace_keys: Optional[pa.Array]):
+        table_dir = os.path.join(self.output_dir, table_name)
+        os.makedirs(table_dir, exist_ok=True)
+        if replace_keys is None:
+            for old_part in glob.glob(os.path.join(table_dir, f"*{self.extension}")):
+                os.remove(old_part)
+        else:
+            self.remove_rows(table_dir, self.config.FACT_REPLACE_KEYS[table_name],
+                             lambda column: self.key_mask(column, replace_keys))
+        if table.num_rows or replace_keys is None:
+            self.write_new_part(table_dir, table)
+
+    def replace_window(self, table_name: str, table: pa.Table, since: date, until: date):
+        table_dir = os.path.join(self.output_dir, table_name)
+        os.makedirs(table_dir, exist_ok=True)
+        self.remove_rows(table_dir, self.config.BACKFILL_DATE_COLUMNS[table_name],
+                         lambda column: self.window_mask(column, since, until))
+        if table.num_rows:
+            self.write_new_part(table_dir, table)
+
+class ParquetSink(FileSink):
+    """Sink writing a Parquet directory per table (row group size = batch size)"""
+
+    name = "parquet"
+    extension = ".parquet"
+
+    def read_part(self, path: str, columns: Optional[List[str]] = None) -> pa.Table:
+        return pq.read_table(path, columns=columns)
+
+    def write_part(self, path: str, table: pa.Table):
+        pq.write_table(table, path, row_group_size=self.batch_size)
+
+class ArrowIPCSink(FileSink):
+    """Sink writing an Arrow IPC file directory per table (record batch size = batch size)"""
+
+    name = "arrow"
+    extension = ".arrow"
+
+    def read_part(self, path: str, columns: Optional[List[str]] = None) -> pa.Table:
+        with ipc.open_file(path) as reader:
+            table = reader.read_all()
+        return table.select(columns) if columns else table
+
+    def write_part(self, path: str, table: pa.Table):
+        with ipc.new_file(path, table.schema) as writer:
+            writer.write_table(table, max_chunksize=self.batch_size)
+
+class SQLiteSink(Sink):
+    """Sink mirroring the tables into a local SQLite database (stand-in for an OLTP mirror)"""
+
+    name = "sqlite"
+
+    def __init__(self, db_path: str, batch_size: Optional[int] = None):
+        super().__init__(batch_size)
+        self.db_path = db_path
+        self.connection = None
+
+    def sqlite_type(self, arrow_type: pa.DataType) -> str:
+        """Map an Arrow type to a SQLite column type"""
+        if pa.types.is_integer(arrow_type) or pa.types.is_boolean(arrow_type):
+            return "INTEGER"
+        if pa.types.is_floating(arrow_type) or pa.types.is_decimal(arrow_type):
+            return "REAL"
+        return "TEXT"
+
+    def to_sqlite_batch(self, batch: pa.RecordBatch) -> pa.RecordBatch:
+        """Cast the columns SQLite has no type for (dates, timestamps, decimals) once per batch"""
+        columns = []
+        for column in batch.columns:
+            if pa.types.is_temporal(column.type):
+                column = pc.cast(column, pa.string())
+            elif pa.types.is_decimal(column.type):
+                column = pc.cast(column, pa.float64())
+            columns.append(column)
+        return pa.RecordBatch.from_arrays(columns, names=batch.schema.names)
+
+    def create_table(self, table_name: str, table: pa.Table, replace: bool):
+        """Create the table on first use (connecting first), dropping the previous one if `replace`"""
+        if self.connection is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # the sink runs on a worker thread of SinkFanout
+            self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        columns = ", ".join(f'"{field.name}" {self.sqlite_type(field.type)}' for field in table.schema)
+        if replace:
+            self.connection.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+        self.connection.execute(f'CREATE TABLE IF NOT EXISTS "{table_name}" ({columns})')
+
+    def insert(self, table_name: str, table: pa.Table):
+        """Insert the rows of a table batch by batch"""
+        placeholders = ", ".join("?" for _ in table.schema)
+        for batch in table.to_batches(max_chunksize=self.batch_size):
+            batch = self.to_sqlite_batch(batch)
+            rows = zip(*(column.to_pylist() for column in batch.columns))
+            self.connection.executemany(f'INSERT INTO "{table_name}" VALUES ({placeholders})', rows)
+
+    def write_table(self, table_name: str, table: pa.Table, replace_keys: Optional[pa.Array]):
+        self.create_table(table_name, table, replace=replace_keys is None)
+        with self.connection:
+            if replace_keys is not None:
+                key = self.config.FACT_REPLACE_KEYS[table_name]
+                self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS replace_keys (key)")
+                self.connection.execute("DELETE FROM replace_keys")
+                self.connection.executemany("INSERT INTO replace_keys VALUES (?)", ((k,) for k in replace_keys.to_pylist()))
+                self.connection.execute(f'DELETE FROM "{table_name}" WHERE "{key}" IN (SELECT key FROM replace_keys)')
+            self.insert(table_name, table)
+
+    def replace_window(self, table_name: str, table: pa.Table, since: date, until: date):
+        self.create_table(table_name, table, replace=False)
+        column = self.config.BACKFILL_DATE_COLUMNS[table_name]
+        with self.connection:
+            # dates and timestamps are stored as ISO text, date() reads both
+            self.connection.execute(f'DELETE FROM "{table_name}" WHERE date("{column}") BETWEEN ? AND ?',
+                                    (since.isoformat(), until.isoformat()))
+            self.insert(table_name, table)
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+class SinkFanout:
+    """
+    Class for writing the transformed tables to all configured sinks concurrently
+
+    Every table is converted to Arrow once (Parquet shards are read once) and the same
+    Arrow table is handed to each sink, the DuckDB warehouse included.
+    With a profiler, each sink's thread is profiled into the run's driver profile.
+    """
+
+    def __init__(self, sinks: List[Sink], profiler: Optional[Profiler] = None):
+        self.sinks = sinks
+        self.profiler = profiler
+
+    @classmethod
+    def from_config(cls, loader: Optional[DataLoader] = None, profiler: Optional[Profiler] = None) -> "SinkFanout":
+        """Build the sinks listed in config.SINKS"""
+        cfg = config()
+        if not cfg.SINKS:
+            raise ValueError("No sinks configured, set SINKS to one or more of duckdb, parquet, arrow, sqlite")
+        factories = {
+            "duckdb": lambda: DuckDBSink(loader),
+            "parquet": lambda: ParquetSink(cfg.PARQUET_SINK_DIR),
+            "arrow": lambda: ArrowIPCSink(cfg.ARROW_SINK_DIR),
+            "sqlite": lambda: SQLiteSink(cfg.SQLITE_SINK_PATH),
+        }
+        unknown = [name for name in cfg.SINKS if name not in factories]
+        if unknown:
+            raise ValueError(f"Unknown sinks: {', '.join(unknown)}, expected {', '.join(factories)}")
+        return cls([factories[name]() for name in cfg.SINKS], profiler)
+
+    def shared_arrow_tables(self, transformed_data: Dict[str, Union[pl.DataFrame, str]]) -> Dict[str, pa.Table]:
+        """Read every transformed table into Arrow once (Parquet shard globs are read as one dataset)"""
+        arrow_tables = {}
+        for table_name, data in transformed_data.items():
+            if isinstance(data, str):
+                arrow_tables[table_name] = ds.dataset(sorted(glob.glob(data)), format="parquet").to_table()
+            else:
+                arrow_tables[table_name] = data.to_arrow()
+        return arrow_tables
+
+    def write_all(self, transformed_data: Dict[str, Union[pl.DataFrame, str]], incremental: bool = False,
+                  fact_keys: Optional[pl.Series] = None) -> bool:
+        """
+        Write the transformed tables to all sinks concurrently
+
+        When a sink fails the run is not committed and its batch is written again by the next run.
+        Every sink replaces the rows it wrote before (dimensions in full, facts by order key),
+        so the sinks that succeeded the first time end up without duplicates.
+
+        Args:
+            incremental: Keep the tables that are not written by this run
+            fact_keys: Order keys whose fact rows are replaced, None replaces the whole fact tables
+
+        Returns:
+            True if every sink wrote every table, False otherwise
+        """
+        arrow_tables = self.shared_arrow_tables(transformed_data)
+        return self.run_sinks(lambda sink: sink.write_all(transformed_data, arrow_tables, incremental, fact_keys))
+
+    def write_window(self, window_data: Dict[str, Union[pl.DataFrame, str]], since: date, until: date) -> bool:
+        """
+        Replace one date window of the backfill tables in all sinks concurrently (a failed
+        sink is brought in line by running the same backfill again, it replaces the window)
+
+        Args:
+            window_data: Table name -> rows of the window (DataFrame or Parquet shard glob)
+            since: First date of the window
+            until: Last date of the window (inclusive)
+
+        Returns:
+            True if every sink replaced the window, False otherwise
+        """
+        arrow_tables = self.shared_arrow_tables(window_data)
+        return self.run_sinks(lambda sink: sink.write_window(arrow_tables, since, until))
+
+    def run_sinks(self, write: Callable[[Sink], bool]) -> bool:
+        """Run one write on every sink concurrently, True if it succeeded on all of them"""
+        with ThreadPoolExecutor(max_workers=len(self.sinks)) as pool:
+            futures = {sink.name: pool.submit(self.profiler.profile_thread(write, f"sink_{sink.name}")
+                                              if self.profiler is not None else write, sink)
+                       for sink in self.sinks}
+            results = {}
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    logger.error(f"[{name}] sink failed: {e}")
+                    results[name] = False
+
+        failed = [name for name, ok in results.items() if not ok]
+        if failed:
+            logger.error(f"Sinks failed: {', '.join(failed)}")
+        return not failed
+
+    def close(self):
+        """Close all sinks"""
+        for sink in self.sinks:
+            sink.close()
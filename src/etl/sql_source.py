@@ -0,0 +1,280 @@
+"""
+Relational database source: read OLTP tables straight into Arrow batches (no CSV dump)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+import duckdb as dd
+import polars as pl
+import pyarrow as pa
+from src.config import config
+
+# Setup logging
+logging.basicConfig(level=getattr(logging, config.LOG_LEVEL),
+                    format='%(asctime)s - %(levelname)s - %(message)s'
+                    )
+logger = logging.getLogger(__name__)
+
+class SQLSource:
+    """
+    Class for extracting source tables from a relational database (SQLite or DuckDB)
+
+    Every table is read with a cursor in chunks of SQL_CHUNK_SIZE rows, each chunk becoming
+    one Arrow record batch. Tables with a partition column are split into SQL_PARTITIONS key
+    ranges read on parallel cursors (one connection each). Tables with a watermark column are
+    pulled incrementally (`WHERE <column> > <last watermark>`); the new watermarks are only
+    recorded by `commit_watermarks`, after the load succeeded.
+
+    The rows of a table are delivered with the same columns as its CSV dump, so the
+    transform does not depend on where a table came from. DataExtractor decides what is
+    read: the pulled rows of the fact sources give the order keys whose rows are read again
+    in full (`keys`) and replaced in the warehouse, a dimension with pulled rows is read whole.
+    """
+
+    # keys per `IN (...)` list of a keyed read, below SQLite's bound parameter limit
+    KEYS_PER_QUERY = 900
+
+    DRIVERS = ("sqlite", "duckdb")
+
+    # SQLite type affinity (first matching substring of the declared type) -> Arrow type,
+    # other declared types (NUMERIC, DATETIME, none) keep the type of their values
+    SQLITE_AFFINITY = (("INT", pa.int64()), ("CHAR", pa.string()), ("CLOB", pa.string()), ("TEXT", pa.string()),
+                       ("REAL", pa.float64()), ("FLOA", pa.float64()), ("DOUB", pa.float64()))
+
+    def __init__(self, db_path: str = None, driver: str = None, watermark_path: str = None):
+        self.config = config()
+        self.db_path = db_path or self.config.SQL_SOURCE_PATH
+        self.driver = driver or self.config.SQL_SOURCE_DRIVER
+        if self.driver not in self.DRIVERS:
+            raise ValueError(f"Unknown SQL source driver: {self.driver}, expected one of {', '.join(self.DRIVERS)}")
+        # source table name (as in config.CSV_FILES) -> database table
+        self.tables = self.config.SQL_SOURCE_TABLES
+        self.watermark_path = watermark_path or self.config.SQL_WATERMARK_PATH
+        self.watermarks = self.read_watermarks()
+        # watermarks reached in this run, recorded by `commit_watermarks`
+        self.pending_watermarks = {}
+
+    def connect(self):
+        """Open a new connection (every parallel cursor uses its own)"""
+        if self.driver == "duckdb":
+            return dd.connect(self.db_path, read_only=True)
+        # read-only URI, the OLTP database is never written
+        return sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+
+    def read_watermarks(self) -> Dict[str, str]:
+        """Read the watermark of every incremental table, empty when none was recorded yet"""
+        if not os.path.exists(self.watermark_path):
+            return {}
+        try:
+            with open(self.watermark_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"Cannot read watermarks {self.watermark_path}, pulling every row: {e}")
+            return {}
+
+    def commit_watermarks(self):
+        """Record the watermarks reached in this run, call after a successful load"""
+        if not self.pending_watermarks:
+            return
+        self.watermarks.update(self.pending_watermarks)
+        directory = os.path.dirname(self.watermark_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.watermark_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.watermarks, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.watermark_path)
+        logger.info(f"Recorded watermarks of {', '.join(self.pending_watermarks)} in {self.watermark_path}")
+        self.pending_watermarks = {}
+
+    def is_incremental(self, name: str) -> bool:
+        """Check whether a table can be pulled past its watermark (it has one recorded)"""
+        return name in self.config.SQL_WATERMARK_COLUMNS and name in self.watermarks
+
+    def columns(self, name: str) -> List[str]:
+        """Return the column names of a source table"""
+        connection = self.connect()
+        try:
+            cursor = connection.execute(f"SELECT * FROM {self.quote(self.tables[name])} LIMIT 0")
+            return [col[0] for col in cursor.description]
+        finally:
+            connection.close()
+
+    def column_types(self, table: str) -> Dict[str, pa.DataType]:
+        """
+        Return the Arrow type of the SQLite columns with a declared type affinity
+
+        A chunk where such a column is all NULL keeps its type instead of Arrow's `null`.
+        DuckDB batches are already typed by the database.
+        """
+        if self.driver != "sqlite":
+            return {}
+        connection = self.connect()
+        try:
+            rows = connection.execute(f"PRAGMA table_info({self.quote(table)})").fetchall()
+        finally:
+            connection.close()
+        types = {}
+        for _, name, declared, *_ in rows:
+            for affinity, arrow_type in self.SQLITE_AFFINITY:
+                if affinity in (declared or "").upper():
+                    types[name] = arrow_type
+                    break
+        return types
+
+    def empty_table(self, name: str) -> pl.DataFrame:
+        """Return a source table without rows, typed like a read of it (a keyed read that matched nothing)"""
+        table = self.tables[name]
+        connection = self.connect()
+        try:
+            cursor = connection.execute(f"SELECT * FROM {self.quote(table)} LIMIT 0")
+            if self.driver == "duckdb":
+                return pl.from_arrow(cursor.to_arrow_table())
+            names = [col[0] for col in cursor.description]
+        finally:
+            connection.close()
+        types = self.column_types(table)
+        return pl.from_arrow(pa.schema([(column, types.get(column, pa.string())) for column in names]).empty_table())
+
+    def check_tables(self) -> bool:
+        """
+        Check that the database and all configured tables exist
+
+        Returns:
+            bool: True if every table is found, False otherwise
+        """
+        if not os.path.exists(self.db_path):
+            logger.error(f"SQL source database not found: {self.db_path}")
+            return False
+        connection = self.connect()
+        try:
+            if self.driver == "duckdb":
+                rows = connection.execute("SELECT table_name FROM information_schema.tables").fetchall()
+            else:
+                rows = connection.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')").fetchall()
+        finally:
+            connection.close()
+        existing = {row[0] for row in rows}
+        missing = [table for table in self.tables.values() if table not in existing]
+        if missing:
+            logger.error(f"Missing tables in {self.db_path}: {', '.join(missing)}")
+            return False
+        logger.info(f"✅ All {len(self.tables)} SQL source tables found!")
+        return True
+
+    def read_batches(self, connection, sql: str, params: list,
+                     types: Optional[Dict[str, pa.DataType]] = None) -> Iterator[pa.RecordBatch]:
+        """
+        Run a query and yield its result in record batches of SQL_CHUNK_SIZE rows
+
+        DuckDB produces the Arrow batches itself, SQLite rows are fetched chunk by chunk
+        and converted column by column (with the types of `column_types`, if given).
+        """
+        types = types or {}
+        chunk_size = self.config.SQL_CHUNK_SIZE
+        if self.driver == "duckdb":
+            yield from connection.execute(sql, params).fetch_record_batch(chunk_size)
+            return
+        cursor = connection.execute(sql, params)
+        names = [col[0] for col in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield pa.RecordBatch.from_arrays([pa.array(col, type=types.get(name))
+                                              for name, col in zip(names, zip(*rows))], names=names)
+
+    def quote(self, identifier: str) -> str:
+        return '"' + identifier.replace('"', '""') + '"'
+
+    def partition_ranges(self, table: str, column: str, where: str, params: list) -> List[Tuple[int, int]]:
+        """
+        Split the key range of an integer column into SQL_PARTITIONS half-open ranges
+
+        Returns:
+            List of (low, high) bounds, empty when the table has no rows to read
+        """
+        connection = self.connect()
+        try:
+            low, high = connection.execute(
+                f"SELECT min({self.quote(column)}), max({self.quote(column)}) FROM {self.quote(table)}{where}", params
+            ).fetchone()
+        finally:
+            connection.close()
+        if low is None:
+            return []
+        partitions = max(1, min(self.config.SQL_PARTITIONS, high - low + 1))
+        step = -(-(high - low + 1) // partitions)
+        return [(start, min(start + step, high + 1)) for start in range(low, high + 1, step)]
+
+    def read_partition(self, sql: str, params: list,
+                       types: Optional[Dict[str, pa.DataType]] = None) -> List[pa.RecordBatch]:
+        """Read one query on its own connection"""
+        connection = self.connect()
+        try:
+            return list(self.read_batches(connection, sql, params, types))
+        finally:
+            connection.close()
+
+    def read_table(self, name: str, incremental: bool = True, key_column: Optional[str] = None,
+                   keys: Optional[list] = None) -> Optional[pl.DataFrame]:
+        """
+        Read one source table
+
+        Args:
+            name: Source table name (key of config.SQL_SOURCE_TABLES)
+            incremental: Only pull the rows past the recorded watermark (if the table has one)
+            key_column, keys: Read only the rows whose key_column is one of keys (all of them,
+                the watermark is ignored and not advanced)
+        Returns:
+            pl.DataFrame with the rows read, None if the table has no new rows
+        """
+        started = time.perf_counter()
+        table = self.tables[name]
+        watermark_column = self.config.SQL_WATERMARK_COLUMNS.get(name)
+        where, params = "", []
+        if keys is None and incremental and watermark_column and name in self.watermarks:
+            where, params = f" WHERE {self.quote(watermark_column)} > ?", [self.watermarks[name]]
+
+        sql = f"SELECT * FROM {self.quote(table)}{where}"
+        types = self.column_types(table)
+        partition_column = self.config.SQL_PARTITION_COLUMNS.get(name)
+        if keys is not None:
+            # one query per slice of keys, read on parallel cursors like the partitions
+            slices = [keys[i:i + self.KEYS_PER_QUERY] for i in range(0, len(keys), self.KEYS_PER_QUERY)]
+            queries = [(f"{sql} WHERE {self.quote(key_column)} IN ({', '.join('?' for _ in part)})", list(part))
+                       for part in slices]
+            with ThreadPoolExecutor(max_workers=max(1, min(len(queries), self.config.SQL_PARTITIONS))) as pool:
+                batches = [batch for part in pool.map(lambda query: self.read_partition(*query, types), queries)
+                           for batch in part]
+        elif partition_column and self.config.SQL_PARTITIONS > 1:
+            ranges = self.partition_ranges(table, partition_column, where, params)
+            condition = f"{self.quote(partition_column)} >= ? AND {self.quote(partition_column)} < ?"
+            queries = [(f"{sql}{' AND ' if where else ' WHERE '}{condition}", params + [low, high])
+                       for low, high in ranges]
+            with ThreadPoolExecutor(max_workers=max(1, len(queries))) as pool:
+                batches = [batch for part in pool.map(lambda query: self.read_partition(*query, types), queries)
+                           for batch in part]
+        else:
+            batches = self.read_partition(sql, params, types)
+
+        batches = [batch for batch in batches if batch.num_rows]
+        if not batches:
+            return None
+        # chunks may infer different types (e.g. a chunk of nulls), relax them to a common one
+        df = pl.concat([pl.from_arrow(batch) for batch in batches], how="vertical_relaxed")
+        # a column that is NULL in every row read and has no declared type is text, like in a CSV dump
+        df = df.with_columns(pl.col(name).cast(pl.String) for name, dtype in df.schema.items() if dtype == pl.Null)
+
+        if watermark_column and keys is None:
+            self.pending_watermarks[name] = str(df[watermark_column].max())
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        logger.info(f"Successfully extracted {len(df)} rows from {self.driver} table {table} in {len(batches)} batches "
+                    f"({elapsed:.2f}s, {len(df) / elapsed:,.0f} rows/s"
+                    f"{', since ' + str(params[0]) if where else ''}{f', {len(keys)} keys' if keys is not None else ''})")
+        return df
@@ -0,0 +1,180 @@
+"""
+Column statistics of the transformed tables and the numeric downcasting they drive
+"""
+
+import os
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Optional, Union
+import polars as pl
+from src.config import config
+
+# Setup logging
+logging.basicConfig(level=getattr(logging, config.LOG_LEVEL),
+                    format='%(asctime)s - %(levelname)s - %(message)s'
+                    )
+logger = logging.getLogger(__name__)
+
+# smallest first: the first type whose range holds [min, max] is used
+INTEGER_TYPES = [
+    (pl.Int8, "TINYINT"),
+    (pl.Int16, "SMALLINT"),
+    (pl.Int32, "INTEGER"),
+    (pl.Int64, "BIGINT"),
+]
+
+class ColumnStats:
+    """
+    Class for collecting per-column statistics (min/max, null fraction, distinct count)
+
+    The statistics of every run are written to STATS_DIR/<run>.json and merged into
+    STATS_DIR/latest.json. Types are chosen from the merged history, so an incremental
+    batch with a narrower range never shrinks a column below what earlier runs loaded.
+    """
+
+    def __init__(self, stats_dir: str = None):
+        self.config = config()
+        self.stats_dir = stats_dir or self.config.STATS_DIR
+        self.latest_path = os.path.join(self.stats_dir, "latest.json")
+        self.history = self.read(self.latest_path)
+        self.run_stats = {}
+
+    def read(self, path: str) -> Dict[str, Dict[str, dict]]:
+        """Read a statistics file, empty when it does not exist"""
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"Cannot read column statistics {path}: {e}")
+            return {}
+
+    def save(self):
+        """Write the statistics of this run and the merged history"""
+        os.makedirs(self.stats_dir, exist_ok=True)
+        run_path = os.path.join(self.stats_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        for path, stats in ((run_path, self.run_stats), (self.latest_path, self.history)):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(stats, f, indent=2, default=str)
+
+    def collect(self, table_name: str, data: Union[pl.DataFrame, str]) -> Dict[str, dict]:
+        """
+        Compute the statistics of every column in one pass
+
+        Args:
+            table_name: Name of the table
+            data: DataFrame, or glob pattern of Parquet shards (scanned lazily)
+        Returns:
+            Dictionary of column -> statistics
+        """
+        lf = pl.scan_parquet(data) if isinstance(data, str) else data.lazy()
+        schema = lf.collect_schema()
+        exprs = [pl.len().alias("__rows")]
+        for name, dtype in schema.items():
+            exprs += [pl.col(name).null_count().alias(f"{name}__nulls"),
+                      pl.col(name).n_unique().alias(f"{name}__distinct")]
+            if dtype.is_numeric():
+                exprs += [pl.col(name).min().alias(f"{name}__min"), pl.col(name).max().alias(f"{name}__max")]
+            if dtype == pl.Float64:
+                # Float32 is only safe when every value survives the round trip
+                exprs.append((pl.col(name).cast(pl.Float32).cast(pl.Float64) == pl.col(name))
+                             .all().alias(f"{name}__f32"))
+        row = lf.select(exprs).collect().row(0, named=True)
+
+        rows = row["__rows"]
+        stats = {}
+        for name, dtype in schema.items():
+            stats[name] = {
+                "dtype": str(dtype),
+                "rows": rows,
+                "null_fraction": row[f"{name}__nulls"] / rows if rows else 0.0,
+                "distinct_count": row[f"{name}__distinct"],
+            }
+            if f"{name}__min" in row:
+                stats[name]["min"] = row[f"{name}__min"]
+                stats[name]["max"] = row[f"{name}__max"]
+            if f"{name}__f32" in row:
+                stats[name]["float32_exact"] = bool(row[f"{name}__f32"])
+        self.run_stats[table_name] = stats
+        self.merge(table_name, stats)
+        return stats
+
+    def merge(self, table_name: str, stats: Dict[str, dict]):
+        """Merge the statistics of a run into the history (widest range seen so far)"""
+        merged = self.history.setdefault(table_name, {})
+        for name, column in stats.items():
+            previous = merged.get(name)
+            if previous is None or previous.get("dtype") != column["dtype"]:
+                merged[name] = dict(column)
+                continue
+            if column.get("min") is not None and previous.get("min") is not None:
+                column["min"] = min(column["min"], previous["min"])
+                column["max"] = max(column["max"], previous["max"])
+            elif previous.get("min") is not None:
+                column["min"], column["max"] = previous["min"], previous["max"]
+            if "float32_exact" in column:
+                column["float32_exact"] = column["float32_exact"] and previous.get("float32_exact", True)
+            column["distinct_count"] = max(column["distinct_count"], previous.get("distinct_count", 0))
+            merged[name] = dict(column)
+
+    def integer_type(self, table_name: str, column: str) -> Optional[tuple]:
+        """
+        Return the smallest (Polars type, DuckDB type) holding the merged range of an integer column,
+        None if the column is not an integer column or has no values yet
+        """
+        stats = self.history.get(table_name, {}).get(column)
+        if not stats or not stats["dtype"].startswith("Int") or stats.get("min") is None:
+            return None
+        for pl_type, duckdb_type in INTEGER_TYPES:
+            low, high = self.integer_bounds(pl_type)
+            if low <= stats["min"] and stats["max"] <= high:
+                return pl_type, duckdb_type
+        return None
+
+    def integer_bounds(self, pl_type) -> tuple:
+        """Return the (min, max) value of a signed Polars integer type"""
+        bits = {pl.Int8: 8, pl.Int16: 16, pl.Int32: 32, pl.Int64: 64}[pl_type]
+        return -(2 ** (bits - 1)), 2 ** (bits - 1) - 1
+
+    def downcast(self, table_name: str, df: pl.DataFrame) -> pl.DataFrame:
+        """Cast the numeric columns of a DataFrame to the smallest safe types"""
+        casts = {}
+        for name, dtype in df.schema.items():
+            target = self.integer_type(table_name, name)
+            if target is not None and target[0] != dtype:
+                casts[name] = target[0]
+            elif dtype == pl.Float64 and self.history.get(table_name, {}).get(name, {}).get("float32_exact"):
+                casts[name] = pl.Float32
+        if not casts:
+            return df
+        before = df.estimated_size()
+        df = df.cast(casts)
+        logger.info(f"Downcast {len(casts)} columns of {table_name}: "
+                    f"{before / 1024 ** 2:.1f} MB -> {df.estimated_size() / 1024 ** 2:.1f} MB")
+        return df
+
+    def duckdb_types(self, table_name: str) -> Dict[str, str]:
+        """Return the smallest DuckDB integer type of every integer column of a table"""
+        types = {}
+        for name in self.history.get(table_name, {}):
+            target = self.integer_type(table_name, name)
+            if target is not None:
+                types[name] = target[1]
+        return types
+
+    def apply(self, transformed_data: Dict[str, Union[pl.DataFrame, str]]) -> Dict[str, Union[pl.DataFrame, str]]:
+        """
+        Collect the statistics of all transformed tables, save them and downcast the DataFrames
+        (Parquet shard globs are left as they are, the loader casts them into the schema types)
+
+        Returns:
+            Dictionary of the downcast tables
+        """
+        downcast_data = {}
+        for table_name, data in transformed_data.items():
+            self.collect(table_name, data)
+            downcast_data[table_name] = data if isinstance(data, str) else self.downcast(table_name, data)
+        self.save()
+        return downcast_data
@@ -3,10 +3,16 @@ Data transformation module for creating dimensional model
 """
 
 import polars as pl
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple, Union
+import os
+import glob
 import logging
-from datetime import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
 from src.config import config
+from src.etl.profiling import Profiler
+from src.etl.dimension_specs import DIMENSION_SPECS, WIDE_SALES_JOINS, wide_sales_columns
 
 
 # Setup logging
@@ -22,10 +28,70 @@ logging.basicConfig(level=getattr(logging, config.LOG_LEVEL),
                     )
 logger = logging.getLogger(__name__)
 
+def build_sales_fact_shard(orders_df: pl.DataFrame, order_details_df: pl.DataFrame, shard_path: str,
+                           profile_run_dir: Optional[str] = None) -> Tuple[int, Dict[str, float]]:
+    """
+    Build one partition of the sales fact table and write it as a Parquet shard
+    (runs in a worker process of the partitioned fact build)
+
+    Args:
+        profile_run_dir: Run directory of the parent's profiler, the shard's plan is written there
+    Returns:
+        Number of rows written and the profiled timings of the shard (empty when not profiling)
+    """
+    profiler = Profiler(run_dir=profile_run_dir) if profile_run_dir else None
+    name = f"fact_sales_{os.path.splitext(os.path.basename(shard_path))[0]}"
+    sales_fact = DataTransformer(profiler).transform_sales_fact(orders_df, order_details_df, name)
+    sales_fact.write_parquet(shard_path)
+    return len(sales_fact), profiler.timings if profiler is not None else {}
+
 class DataTransformer:
-    def __init__(self):
+    # format of the date columns in the source files
+    SOURCE_DATETIME_FORMAT = "%m/%d/%Y %H:%M:%S"
+
+    def __init__(self, profiler: Optional[Profiler] = None):
         self.config = config()
+        self.profiler = profiler
         # self.transformed_data = {}
+        # the date dimension does not depend on the source data, build it once per process
+        self.date_dimension = None
+        # latest snapshot of every dimension, used to enrich fact_sales_wide when a run
+        # does not rebuild a dimension (seeded from the warehouse by the pipeline)
+        self.dimensions = {}
+
+    def collect(self, lf: pl.LazyFrame, name: str) -> pl.DataFrame:
+        """
+        Collect the lazy plan of a transform (profiled when profiling is enabled)
+        
+        Args:
+            lf: LazyFrame of the transform
+            name: Name of the output table
+        Returns:
+            The collected DataFrame
+        """
+        if self.profiler is not None:
+            return self.profiler.collect(lf, name)
+        return lf.collect()
+
+    def sink_parquet(self, lf: pl.LazyFrame, path: str, name: str):
+        """Stream the lazy plan of a transform into a Parquet file (profiled when profiling is enabled)"""
+        if self.profiler is not None:
+            self.profiler.sink_parquet(lf, path, name)
+        else:
+            lf.sink_parquet(path)
+
+    def collect_all(self, plans: Dict[str, pl.LazyFrame]) -> Dict[str, pl.DataFrame]:
+        """
+        Collect several lazy plans at once (profiled when profiling is enabled)
+        
+        Args:
+            plans: Dictionary of output table name -> LazyFrame
+        Returns:
+            Dictionary of output table name -> DataFrame
+        """
+        if self.profiler is not None:
+            return self.profiler.collect_all(plans)
+        return dict(zip(plans, pl.collect_all(list(plans.values()))))
 
     def standardize_column_names(self, df: pl.DataFrame) -> pl.DataFrame:
         """
@@ -39,174 +105,70 @@ class DataTransformer:
         new_columns = [col.lower().replace(' ', '_').replace('-', '_') for col in df.columns]
         return df.rename(dict(zip(df.columns, new_columns)))       
 
-    def transform_Airlines(self,df: pl.DataFrame) -> pl.DataFrame:
-        """Transform customers data into dimension table
-            1. select columns `id` (rename to `customer_id`), `company` (rename to `company_name`)
-                `first_name`, `last_name`, `email_address`, `job_title`, `business_phone`
-                , `address`, `city`, `state_province`, `country_region`, 
-                    and `zip_postal_code` (renamed to `postal_code`)
-            2. create full_name by concatenating first_name and last_name
-            3. sort by `id` and filter out rows where `id` is null
-            4. create timestamp columns created_at and updated_at
-        """
-        logging.info("=== Transforming customers dimension ===")
-        
-        # Standardize column names (lowercase, replace spaces and hyphen with underscores)
-        df_clean = self.standardize_column_names(df)
-        
-        # Transform the DataFrame
-        dim_customers = (df_clean.select(
-                                    pl.col("id").alias("customer_id"),
-                                    pl.col("company").alias("company_name"),
-                                    pl.col("first_name"),
-                                    pl.col("last_name"),
-                                    pl.col("email_address"),
-                                    pl.col("job_title"),
-                                    pl.col("business_phone"),
-                                    pl.col("address"),
-                                    pl.col("city"),
-                                    pl.col("state_province"),
-                                    pl.col("country_region"),
-                                    pl.col("zip_postal_code").alias("postal_code"),
-                                    pl.concat_str([pl.col("first_name"), pl.col("last_name")], separator=" ").alias("full_name"),
-                                    pl.lit(datetime.now()).alias("created_at"),
-                                    pl.lit(datetime.now()).alias("updated_at"))
-                        .unique(
-                            "customer_id"
-                            )
-                        .sort(
-                            "customer_id"
-                            )
-                        .filter(
-                            pl.col("customer_id")
-                            .is_not_null()
-                            ))
-        
-        return dim_customers
-    
-    def transform_Airplanes(self,df: pl.DataFrame) -> pl.DataFrame:
-        """
-        Transform employees data into dimension table
-        1. select columns `id` (rename to `employee_key`), `company`, `first_name`, `last_name`
-            , `email_address`, `job_title`, `business_phone`, `city`, `state_province`, 
-            and `country_region`
-        2. create full_name by concatenating first_name and last_name
-        3. create timestamp columns created_at and updated_at
+    def compile_dimension(self, name: str, spec: dict, df: pl.DataFrame, now: datetime) -> pl.LazyFrame:
+        """Compile one dimension spec into a lazy plan
+            1. filter out rows with a null key (before dedup, so dedup sees fewer rows)
+            2. select the mapped and derived columns and the timestamps created_at and updated_at
+            3. keep one row per key according to the dedup policy, without a full sort
+
+        Returns:
+            LazyFrame of the dimension
+        Raises:
+            ValueError: If the source misses columns of the spec (the run fails, so the
+                source file is not recorded as ingested and is read again by the next run)
         """
-        logging.info("=== Transforming employees dimension ===")
-        
         df_clean = self.standardize_column_names(df)
-        
-        # Create employee dimension
-        
-        dim_employees = (df_clean.select(
-                                    pl.col("id").alias("employee_key"),
-                                    pl.col("company"),
-                                    pl.col("first_name"),
-                                    pl.col("last_name"),
-                                    pl.col("email_address"),
-                                    pl.col("job_title"),
-                                    pl.col("business_phone"),
-                                    pl.col("city"),
-                                    pl.col("state_province"),
-                                    pl.col("country_region"),
-                                    pl.concat_str([pl.col("first_name"), pl.col("last_name")], separator=" ").alias("full_name"),
-                                    pl.lit(datetime.now()).alias("created_at"),
-                                    pl.lit(datetime.now()).alias("updated_at"))
-                        .unique(
-                            "employee_key"
-                            )
-                        .sort(
-                            "employee_key"
-                            )
-                        .filter(
-                            pl.col("employee_key")
-                            .is_not_null()
-                            ))
-        
-        return dim_employees
-    
-    def transform_Airports(self, df: pl.DataFrame) -> pl.DataFrame:
-        """Transform products data into dimension table
-            1. select columns `id` (rename to `product_key`), `product_code`, `product_name`,
-            `description`, `category`, `standard_cost`, `list_price`, `quantity_per_unit`,
-            `reorder_level`, `target_level`, `minimum_reorder_quantity`, `discontinued`
-            2. create is_discontinued column as boolean based on discontinued value
-            3. create timestamp columns created_at and updated_at
+        if spec["columns"] == "*":
+            key_source = spec["key_source"]
+            columns = {spec["key"]: key_source,
+                       **{col: col for col in df_clean.columns if col != key_source}}
+        else:
+            columns = spec["columns"]
+            key_source = columns[spec["key"]]
+
+        derived = spec.get("derived", {})
+        needed = set(columns.values()) | {col for expr in derived.values() for col in expr.meta.root_names()}
+        missing = sorted(needed - set(df_clean.columns))
+        if missing:
+            raise ValueError(f"Cannot build {name}: {spec['source']} has no columns {', '.join(missing)}")
+
+        lf = (df_clean.lazy()
+                .filter(pl.col(key_source).is_not_null())
+                .select(
+                    *[pl.col(source).alias(target) for target, source in columns.items()],
+                    *[expr.alias(target) for target, expr in derived.items()],
+                    pl.lit(now).alias("created_at"),
+                    pl.lit(now).alias("updated_at")))
+
+        dedup = spec.get("dedup", "first")
+        if dedup in ("first", "last"):
+            lf = lf.unique(spec["key"], keep=dedup, maintain_order=True)
+        elif dedup == "any":
+            lf = lf.unique(spec["key"], keep="any")
+        if spec.get("sort"):
+            lf = lf.sort(spec["key"])
+        return lf
+
+    def transform_dimensions(self, raw_data: Dict[str, pl.DataFrame]) -> Dict[str, pl.DataFrame]:
         """
-        logger.info("Transforming products dimension")
-        
-        df_clean = self.standardize_column_names(df)
+        Build every dimension of DIMENSION_SPECS whose source table is in raw_data.
+        All plans are collected together, so Polars optimizes and runs them in parallel.
         
-        # Create product dimension
-        dim_product = (df_clean.select(
-                                    pl.col("id").alias("product_key"),
-                                    pl.col("product_code"),
-                                    pl.col("product_name"),
-                                    pl.col("description"),
-                                    pl.col("category"),
-                                    pl.col("standard_cost"),
-                                    pl.col("list_price"),
-                                    pl.col("quantity_per_unit"),
-                                    pl.col("reorder_level"),
-                                    pl.col("target_level"),
-                                    pl.col("minimum_reorder_quantity"),
-                                    (pl.col("discontinued").cast(str) == "Yes").alias("is_discontinued"),  # Fix: cast to string before compare
-                                    pl.lit(datetime.now()).alias("created_at"),
-                                    pl.lit(datetime.now()).alias("updated_at"))
-                        .unique(
-                            "product_key"
-                            )
-                        .sort(
-                            "product_key"
-                            )
-                        .filter(
-                            pl.col("product_key")
-                            .is_not_null()
-                            ))
-        
-        return dim_product
-    
-    def transform_Routes(self, df: pl.DataFrame) -> pl.DataFrame:
-        """Transform suppliers data into dimension table
-            1. select columns `id` (rename to `supplier_key`), `company`, `first_name`, `last_name`
-                , `email_address`, `job_title`, `business_phone`, `city`, `state_province`, 
-                and `country_region`
-            2. create full_name by concatenating first_name and last_name
-            3. create timestamp columns created_at and updated_at
+        Args:
+            raw_data: Dictionary of raw DataFrames
+        Returns:
+            Dictionary of dimension DataFrames
         """
-        logger.info("Transforming suppliers dimension")
-        
-        df_clean = self.standardize_column_names(df)
-        
-        # Create supplier dimension
-        dim_supplier = (df_clean.select(
-                                    pl.col("id").alias("supplier_key"),
-                                    pl.col("company"),
-                                    pl.col("first_name"),
-                                    pl.col("last_name"),
-                                    pl.col("email_address"),
-                                    pl.col("job_title"),
-                                    pl.col("business_phone"),
-                                    pl.col("city"),
-                                    pl.col("state_province"),
-                                    pl.col("country_region"),
-                                    pl.concat_str([pl.col("first_name"), pl.col("last_name")], separator=" ").alias("full_name"),
-                                    pl.lit(datetime.now()).alias("created_at"),
-                                    pl.lit(datetime.now()).alias("updated_at"))
-                        .unique(
-                            "supplier_key"
-                            )
-                        .sort(
-                            "supplier_key"
-                            )
-                        .filter(
-                            pl.col("supplier_key")
-                            .is_not_null()
-                            ))
-        
-        return dim_supplier
-    
+        now = datetime.now()
+        plans = {}
+        for name, spec in DIMENSION_SPECS.items():
+            if spec["source"] in raw_data:
+                plans[name] = self.compile_dimension(name, spec, raw_data[spec["source"]], now)
+        if not plans:
+            return {}
+        logger.info(f"Transforming dimensions {', '.join(plans)}")
+        return self.collect_all(plans)
+
     def get_fiscal_quarter(self,start_month: int) -> pl.Expr:
         """
         Returns a Polars expression to calculate the fiscal quarter.
@@ -263,12 +225,15 @@ class DataTransformer:
         logger.info(f"Created date dimension with {len(dim_date)} records")
         return dim_date
     
-    def transform_sales_fact(self, orders_df: pl.DataFrame, order_details_df: pl.DataFrame) -> pl.DataFrame:
+    def transform_sales_fact(self, orders_df: pl.DataFrame, order_details_df: pl.DataFrame,
+                             name: str = "fact_sales") -> pl.DataFrame:
         """Transform orders and order details into sales fact table
             1. Clean the data by standardizing column names
             2. Join orders with order details
             3. Select relevant columns and calculate derived metrics
             4. Create timestamp columns created_at and updated_at
+
+        `name` is the name the plan is profiled under (one per shard of a partitioned build).
         """
         logger.info("Transforming sales fact table")
         
@@ -277,19 +242,20 @@ class DataTransformer:
         df_order_details = self.standardize_column_names(order_details_df)
         
         # Join orders with order details
-        df_order_join = df_orders.join(
-                                    df_order_details,
+        df_order_join = df_orders.lazy().join(
+                                    df_order_details.lazy(),
                                     left_on="id",
                                     right_on="order_id",
                                     how="inner"
                             )
         sales_fact = df_order_join.select([
-                                        pl.col("id").alias("sale_id"),
+                                        pl.col("id_right").alias("sale_id"),  # order line id
+                                        pl.col("id").alias("order_id"),
                                         pl.col("customer_id").alias("customer_key"),
                                         pl.col("employee_id").alias("employee_key"),
                                         pl.col("product_id").alias("product_key"),
-                                        pl.col("order_date").str.to_datetime(format="%m/%d/%Y %H:%M:%S").alias("order_date_key"),
-                                        pl.col("shipped_date").str.to_datetime("%m/%d/%Y %H:%M:%S").alias("shipped_date_key"),
+                                        self.source_datetime("order_date", df_orders.schema["order_date"]).alias("order_date_key"),
+                                        self.source_datetime("shipped_date", df_orders.schema["shipped_date"]).alias("shipped_date_key"),
                                         pl.col("quantity"),
                                         pl.col("unit_price"),
                                         pl.col("discount"),
@@ -300,9 +266,138 @@ class DataTransformer:
                                         pl.col("status_id").alias("order_status_id"),
                                         pl.lit(datetime.now()).alias("created_at")
                                 ])
-        return sales_fact
+        return self.collect(sales_fact, name)
     
-    def transform_all_data(self, raw_data: Dict[str, pl.DataFrame]) -> Dict[str, pl.DataFrame]:
+    def source_datetime(self, column: str, dtype: pl.DataType) -> pl.Expr:
+        """
+        Parse a source date column into a datetime
+        
+        CSV date columns are read as text (config.SOURCE_DATE_COLUMNS) and parsed strictly in
+        the source format: a malformed date fails the run instead of becoming null or a date
+        with day and month swapped. A typed database column (e.g. a DuckDB TIMESTAMP) is cast.
+        """
+        if dtype.is_temporal():
+            return pl.col(column).cast(pl.Datetime("us"))
+        return pl.col(column).str.to_datetime(format=self.SOURCE_DATETIME_FORMAT, strict=True)
+    
+    def orders_window_filter(self, schema: Dict[str, pl.DataType], date_window: Tuple[date, date]) -> pl.Expr:
+        """
+        Build the predicate keeping the raw orders whose order date falls in the window
+        (both ends inclusive). A backfill applies it while scanning the orders, so only the
+        orders of the window are read, joined and transformed.
+        
+        Args:
+            schema: Schema of the raw orders (source column names)
+            date_window: (since, until) dates
+        Returns:
+            Boolean expression over the raw orders
+        """
+        since, until = date_window
+        column = next(col for col in schema if col.lower().replace(' ', '_').replace('-', '_') == "order_date")
+        return self.source_datetime(column, schema[column]).dt.date().is_between(since, until)
+
+    def transform_sales_fact_partitioned(self, orders_df: pl.DataFrame, order_details_df: pl.DataFrame,
+                                         num_partitions: int) -> str:
+        """Build the sales fact table partition by partition on a process pool
+            1. Hash-partition orders and order details on the order id
+            2. Join and transform each partition in its own process
+            3. Write each partition's fact slice as a Parquet shard
+
+        Returns:
+            Glob pattern of the Parquet shards, to be bulk-loaded by the loader
+        """
+        logger.info(f"Transforming sales fact table in {num_partitions} partitions")
+
+        df_orders = self.standardize_column_names(orders_df)
+        df_order_details = self.standardize_column_names(order_details_df)
+
+        shard_dir = os.path.join(self.config.FACT_SHARD_DIR, "fact_sales")
+        os.makedirs(shard_dir, exist_ok=True)
+        for old_shard in glob.glob(os.path.join(shard_dir, "*.parquet")):
+            os.remove(old_shard)
+
+        # hash both sides on the same dtype so matching order ids land in the same partition
+        key_dtype = df_orders.schema["id"]
+        orders_parts = df_orders.with_columns(
+            (pl.col("id").hash() % num_partitions).alias("_partition")
+        ).partition_by("_partition", as_dict=True, include_key=False)
+        details_parts = df_order_details.with_columns(
+            (pl.col("order_id").cast(key_dtype).hash() % num_partitions).alias("_partition")
+        ).partition_by("_partition", as_dict=True, include_key=False)
+
+        # spawn instead of fork: forking a process that already runs Polars threads can deadlock
+        with ProcessPoolExecutor(max_workers=self.config.FACT_WORKERS,
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {}
+            for key, orders_part in orders_parts.items():
+                details_part = details_parts.get(key)
+                if details_part is None:
+                    continue
+                shard_path = os.path.join(shard_dir, f"part-{key[0]:05d}.parquet")
+                futures[shard_path] = pool.submit(build_sales_fact_shard, orders_part, details_part, shard_path,
+                                                  self.profiler.run_dir if self.profiler is not None else None)
+            total_rows = 0
+            for future in futures.values():
+                rows, timings = future.result()
+                total_rows += rows
+                if self.profiler is not None:
+                    self.profiler.timings.update(timings)
+
+        if not futures:
+            # no order has details (e.g. an empty backfill window): write an empty shard with
+            # the fact schema, so the glob still matches for the statistics and the loader
+            self.transform_sales_fact(df_orders.clear(), df_order_details.clear()).write_parquet(
+                os.path.join(shard_dir, "part-00000.parquet")
+            )
+
+        logger.info(f"Wrote {total_rows} sales fact rows in {len(futures)} shards to {shard_dir}")
+        return os.path.join(shard_dir, "*.parquet")
+
+    def transform_wide_sales(self, sales_fact: Union[pl.DataFrame, str],
+                             dimensions: Dict[str, pl.DataFrame]) -> Union[pl.DataFrame, str]:
+        """Denormalize the sales fact table into fact_sales_wide
+            1. Cast the date keys to dates (the warehouse stores them as DATE)
+            2. Left-join every dimension of WIDE_SALES_JOINS, keeping only the selected attributes
+            3. Collect it, or write it as one Parquet shard when the fact was built in shards
+
+        The dimensions are the right (build) side of each hash join: the small tables are hashed
+        once and probed by every fact partition, the broadcast join of a distributed engine.
+
+        Returns:
+            The wide DataFrame, or the glob pattern of its Parquet shard
+        """
+        logger.info("Transforming wide sales table")
+        lf = pl.scan_parquet(sales_fact) if isinstance(sales_fact, str) else sales_fact.lazy()
+        lf = lf.with_columns(pl.col("order_date_key").cast(pl.Date), pl.col("shipped_date_key").cast(pl.Date))
+        schema = lf.collect_schema()
+        attributes = self.config.WIDE_SALES_ATTRIBUTES
+
+        for dim_name, join in WIDE_SALES_JOINS.items():
+            columns = wide_sales_columns(join, attributes)
+            if not columns:
+                continue
+            dim_df = dimensions.get(dim_name)
+            if dim_df is None:
+                logger.warning(f"{dim_name} is not available, fact_sales_wide is built without {', '.join(columns)}")
+                continue
+            fact_key = join["fact_key"]
+            dim_lf = dim_df.lazy().select(
+                pl.col(join["dim_key"]).cast(schema[fact_key]).alias(fact_key),
+                *[pl.col(src).alias(col) for col, src in columns.items()]
+            ).unique(subset=fact_key, keep="any")
+            lf = lf.join(dim_lf, on=fact_key, how="left")
+
+        if not isinstance(sales_fact, str):
+            return self.collect(lf, "fact_sales_wide")
+
+        shard_dir = os.path.join(self.config.FACT_SHARD_DIR, "fact_sales_wide")
+        os.makedirs(shard_dir, exist_ok=True)
+        for old_shard in glob.glob(os.path.join(shard_dir, "*.parquet")):
+            os.remove(old_shard)
+        self.sink_parquet(lf, os.path.join(shard_dir, "part-00000.parquet"), "fact_sales_wide")
+        return os.path.join(shard_dir, "*.parquet")
+
+    def transform_all_data(self, raw_data: Dict[str, pl.DataFrame]) -> Dict[str, Union[pl.DataFrame, str]]:
         """
         Transform all raw data into dimensional model
         
@@ -310,33 +405,40 @@ class DataTransformer:
             raw_data: Dictionary of raw DataFrames
             
         Returns:
-            Dictionary of transformed DataFrames
+            Dictionary of transformed DataFrames (a fact table built in partitions
+            is returned as the glob pattern of its Parquet shards)
         """
         logger.info("Starting data transformation process")
         
         transformed = {}
         
         # Create dimensions
-        if "Airlines" in raw_data:
-            transformed["dim_Airlines"] = self.transform_Airlines(raw_data["Airlines"])
-   
-        if "Airplanes" in raw_data:
-            transformed["Airplanes"] = self.transform_Airplanes(raw_data["Airplanes"])
-
-        if "Airports" in raw_data:
-            transformed["dim_Airports"] = self.transform_Airports(raw_data["Airports"])
-        
-        if "Routes" in raw_data:
-            transformed["dim_Routes"] = self.transform_Routes(raw_data["Routes"])
+        transformed.update(self.transform_dimensions(raw_data))
+        spec_sources = {spec["source"] for spec in DIMENSION_SPECS.values()}
+        not_transformed = sorted(set(raw_data) - spec_sources - {"orders", "order_details"})
+        if not_transformed:
+            logger.warning(f"No transform for source tables: {', '.join(not_transformed)}")
         # Create date dimension
-        transformed["dim_date"] = self.create_date_dimension()
+        if self.date_dimension is None:
+            self.date_dimension = self.create_date_dimension()
+        transformed["dim_date"] = self.date_dimension
+        self.dimensions.update({name: df for name, df in transformed.items() if name.startswith("dim_")})
         
         # Create fact tables
         if "orders" in raw_data and "order_details" in raw_data:
-            transformed["fact_sales"] = self.transform_sales_fact(
-                raw_data["orders"], 
-                raw_data["order_details"]
-            )
+            if self.config.FACT_PARTITIONS > 0:
+                transformed["fact_sales"] = self.transform_sales_fact_partitioned(
+                    raw_data["orders"],
+                    raw_data["order_details"],
+                    self.config.FACT_PARTITIONS
+                )
+            else:
+                transformed["fact_sales"] = self.transform_sales_fact(
+                    raw_data["orders"], 
+                    raw_data["order_details"]
+                )
+            if self.config.WIDE_SALES:
+                transformed["fact_sales_wide"] = self.transform_wide_sales(transformed["fact_sales"], self.dimensions)
         
         logger.info(f"Transformation complete. Created {len(transformed)} tables")
         return transformed
\ No newline at end of file
@@ -0,0 +1,64 @@
+"""
+Polling watcher of the source files for the watch-mode (micro-batch) pipeline
+"""
+
+import os
+import time
+import logging
+from typing import Dict, List, Tuple
+from src.config import config
+
+# Setup logging
+logging.basicConfig(level=getattr(logging, config.LOG_LEVEL),
+                    format='%(asctime)s - %(levelname)s - %(message)s'
+                    )
+logger = logging.getLogger(__name__)
+
+class SourceWatcher:
+    """
+    Class for watching the configured source files and grouping changes into micro-batches
+    """
+
+    def __init__(self, poll_interval: float = None, debounce: float = None):
+        self.config = config()
+        self.poll_interval = poll_interval if poll_interval is not None else self.config.WATCH_POLL_INTERVAL
+        self.debounce = debounce if debounce is not None else self.config.WATCH_DEBOUNCE_SECONDS
+        # path -> (size, mtime) seen at the previous poll, empty so existing files form the first batch
+        self.seen = {}
+
+    def snapshot(self) -> Dict[str, Tuple[int, float]]:
+        """
+        Stat all files matching the configured source patterns
+        Returns:
+            dict: file path -> (size, mtime)
+        """
+        files = {}
+        for table_name in self.config.CSV_FILES:
+            for path in self.config.get_csv_paths(table_name):
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    # removed between glob and stat
+                    continue
+                files[path] = (stat.st_size, stat.st_mtime)
+        return files
+
+    def wait_for_batch(self) -> List[str]:
+        """
+        Block until files were added or changed and then stayed unchanged for `debounce` seconds
+        Returns:
+            list[str]: the new or changed file paths of the batch
+        """
+        pending = set()
+        last_change = time.monotonic()
+        while True:
+            current = self.snapshot()
+            changed = [path for path, stat in current.items() if self.seen.get(path) != stat]
+            self.seen = current
+            if changed:
+                pending.update(changed)
+                last_change = time.monotonic()
+            elif pending and time.monotonic() - last_change >= self.debounce:
+                logger.info(f"Detected {len(pending)} new or changed source files")
+                return sorted(pending)
+            time.sleep(self.poll_interval)
@@ -0,0 +1,271 @@
+"""
+Query module for reading the DuckDB data warehouse
+
+Results are streamed as Arrow record batches (or Polars DataFrames built from them)
+so large exports and dashboards can consume them with bounded memory. When the
+denormalized fact_sales_wide table is enabled, in sync with fact_sales and holds
+every requested column, it is scanned instead of joining the dimensions.
+
+Example:
+--------
+from src.query import WarehouseQuery
+
+with WarehouseQuery() as wq:
+    for df in wq.sales_frames("2024-01-01", "2024-01-31", columns=["order_date", "product_name", "net_amount"]):
+        ...
+"""
+
+import duckdb as dd
+import polars as pl
+import pyarrow as pa
+import logging
+from datetime import date
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+from src.config import config
+
+# Setup logging
+logging.basicConfig(level=getattr(logging, config.LOG_LEVEL),
+                    format='%(asctime)s - %(levelname)s - %(message)s'
+                    )
+logger = logging.getLogger(__name__)
+
+DateLike = Union[str, date]
+Keys = Union[int, Sequence[int], None]
+
+class WarehouseQuery:
+    """Class for parameterized, streaming star-schema queries over the warehouse"""
+
+    # column name -> (SQL expression, dimension alias it needs)
+    SALES_COLUMNS = {
+        "sale_id": ("f.sale_id", None),
+        "order_id": ("f.order_id", None),
+        "order_date": ("f.order_date_key", None),
+        "shipped_date": ("f.shipped_date_key", None),
+        "year": ("d.year", "d"),
+        "quarter": ("d.quarter", "d"),
+        "month": ("d.month", "d"),
+        "customer_key": ("f.customer_key", None),
+        "customer_name": ("c.full_name", "c"),
+        "company_name": ("c.company_name", "c"),
+        "employee_key": ("f.employee_key", None),
+        "employee_name": ("e.full_name", "e"),
+        "product_key": ("f.product_key", None),
+        "product_name": ("p.product_name", "p"),
+        "category": ("p.category", "p"),
+        "quantity": ("f.quantity", None),
+        "unit_price": ("f.unit_price", None),
+        "discount": ("f.discount", None),
+        "gross_amount": ("f.gross_amount", None),
+        "net_amount": ("f.net_amount", None),
+        "shipping_fee": ("f.shipping_fee", None),
+        "taxes": ("f.taxes", None),
+        "order_status_id": ("f.order_status_id", None),
+    }
+
+    DIMENSION_JOINS = {
+        "d": "LEFT JOIN dim_date d ON d.date_key = f.order_date_key",
+        "c": "LEFT JOIN dim_customers c ON c.customer_id = f.customer_key",
+        "e": "LEFT JOIN dim_employees e ON e.employee_key = f.employee_key",
+        "p": "LEFT JOIN dim_products p ON p.product_key = f.product_key",
+    }
+
+    # summary grouping -> output columns (from SALES_COLUMNS)
+    GROUPINGS = {
+        "date": ["order_date"],
+        "month": ["year", "month"],
+        "product": ["product_key", "product_name"],
+        "employee": ["employee_key", "employee_name"],
+        "customer": ["customer_key", "customer_name"],
+    }
+
+    def __init__(self, db_path: str = None):
+        self.config = config()
+        self.db_path = db_path or self.config.DATABASE_PATH
+        self.connection = None
+        self._wide_columns = None
+
+    def connect(self) -> dd.DuckDBPyConnection:
+        """Open a read-only connection to the warehouse"""
+        if not self.connection:
+            self.connection = dd.connect(self.db_path, read_only=True)
+            logger.info(f"Connected to DuckDB at {self.db_path} (read-only)")
+        return self.connection
+
+    def disconnect(self):
+        """Close database connection"""
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *exc):
+        self.disconnect()
+
+    def _key_filter(self, column: str, keys: Keys, params: list) -> Optional[str]:
+        """Build an `IN (...)` filter for one key or a list of keys"""
+        if keys is None:
+            return None
+        if isinstance(keys, int):
+            keys = [keys]
+        params.extend(keys)
+        return f"{column} IN ({', '.join('?' for _ in keys)})"
+
+    def _sales_filters(self, start_date: DateLike, end_date: DateLike, product_key: Keys,
+                       employee_key: Keys, customer_key: Keys) -> Tuple[List[str], list]:
+        """Build the WHERE conditions and parameters shared by all sales queries"""
+        # the date range goes first, it is the filter the zone maps of fact_sales can prune on
+        conditions = ["f.order_date_key BETWEEN ?::DATE AND ?::DATE"]
+        params = [str(start_date), str(end_date)]
+        for column, keys in (("f.product_key", product_key),
+                             ("f.employee_key", employee_key),
+                             ("f.customer_key", customer_key)):
+            condition = self._key_filter(column, keys, params)
+            if condition:
+                conditions.append(condition)
+        return conditions, params
+
+    def _joins(self, columns: List[str]) -> str:
+        """Join only the dimensions needed by the selected columns"""
+        aliases = {self.SALES_COLUMNS[col][1] for col in columns} - {None}
+        return "\n".join(self.DIMENSION_JOINS[alias] for alias in self.DIMENSION_JOINS if alias in aliases)
+
+    def wide_columns(self) -> set:
+        """
+        Columns of fact_sales_wide, empty when the table is disabled (config.WIDE_SALES),
+        was not built, or does not hold the same rows as fact_sales (a load stopped between them)
+        """
+        if self._wide_columns is None:
+            self._wide_columns = set()
+            if not self.config.WIDE_SALES:
+                return self._wide_columns
+            self.connect()
+            rows = self.connection.execute(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = 'fact_sales_wide'"
+            ).fetchall()
+            if rows:
+                wide_rows, fact_rows = self.connection.execute(
+                    "SELECT (SELECT count(*) FROM fact_sales_wide), (SELECT count(*) FROM fact_sales)"
+                ).fetchone()
+                if wide_rows == fact_rows:
+                    self._wide_columns = {row[0] for row in rows}
+                else:
+                    logger.warning(f"fact_sales_wide is out of date ({wide_rows} rows, fact_sales {fact_rows}), "
+                                   "reading the star schema")
+        return self._wide_columns
+
+    def _source(self, columns: List[str]) -> Tuple[str, dict]:
+        """
+        Pick the table to read the columns from
+
+        Returns:
+            FROM clause (with the needed joins) and output column -> SQL expression
+        """
+        # the wide table names fact columns like fact_sales and dimension attributes like the output column
+        wide = {col: expr if alias is None else f"f.{col}"
+                for col, (expr, alias) in self.SALES_COLUMNS.items() if col in columns}
+        if all(expr[2:] in self.wide_columns() for expr in wide.values()):
+            return "fact_sales_wide f", wide
+        return f"fact_sales f\n{self._joins(columns)}", {col: self.SALES_COLUMNS[col][0] for col in columns}
+
+    def _check_columns(self, columns: Sequence[str]):
+        unknown = [col for col in columns if col not in self.SALES_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+
+    def sales_query(self, start_date: DateLike, end_date: DateLike, product_key: Keys = None,
+                    employee_key: Keys = None, customer_key: Keys = None,
+                    columns: Optional[Sequence[str]] = None, limit: Optional[int] = None,
+                    offset: int = 0) -> Tuple[str, list]:
+        """
+        Build the sales line query of a date range
+
+        Args:
+            start_date, end_date: Inclusive order date range
+            product_key, employee_key, customer_key: Optional key (or list of keys) filters
+            columns: Columns to return (see SALES_COLUMNS), all when None
+            limit, offset: Page of the result, ordered by order date and sale id
+
+        Returns:
+            SQL and its parameters
+        """
+        columns = list(columns or self.SALES_COLUMNS)
+        self._check_columns(columns)
+        conditions, params = self._sales_filters(start_date, end_date, product_key, employee_key, customer_key)
+        source, expressions = self._source(columns)
+        select_list = ", ".join(f"{expressions[col]} AS {col}" for col in columns)
+        sql = f"""
+            SELECT {select_list}
+            FROM {source}
+            WHERE {' AND '.join(conditions)}
+            ORDER BY f.order_date_key, f.sale_id
+        """
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([limit, offset])
+        return sql, params
+
+    def summary_query(self, by: str, start_date: DateLike, end_date: DateLike, product_key: Keys = None,
+                      employee_key: Keys = None, customer_key: Keys = None) -> Tuple[str, list]:
+        """
+        Build the sales summary query of a date range grouped by date, month, product, employee or customer
+
+        Returns:
+            SQL and its parameters
+        """
+        if by not in self.GROUPINGS:
+            raise ValueError(f"Unknown grouping: {by}, expected one of {', '.join(self.GROUPINGS)}")
+        group_columns = self.GROUPINGS[by]
+        conditions, params = self._sales_filters(start_date, end_date, product_key, employee_key, customer_key)
+        source, expressions = self._source(group_columns + ["order_id", "quantity", "gross_amount", "net_amount"])
+        group_list = ", ".join(f"{expressions[col]} AS {col}" for col in group_columns)
+        sql = f"""
+            SELECT {group_list},
+                   count(DISTINCT f.order_id) AS orders,
+                   sum(f.quantity) AS quantity,
+                   sum(f.gross_amount) AS gross_amount,
+                   sum(f.net_amount) AS net_amount
+            FROM {source}
+            WHERE {' AND '.join(conditions)}
+            GROUP BY ALL
+            ORDER BY {', '.join(group_columns)}
+        """
+        return sql, params
+
+    def stream(self, sql: str, params: list, batch_size: Optional[int] = None) -> pa.RecordBatchReader:
+        """
+        Execute a query and stream its result as Arrow record batches
+
+        Args:
+            sql: Query to execute
+            params: Query parameters
+            batch_size: Rows per record batch, defaults to config.QUERY_BATCH_SIZE
+
+        Returns:
+            pyarrow RecordBatchReader, the result is produced batch by batch while reading
+        """
+        self.connect()
+        return self.connection.execute(sql, params).fetch_record_batch(batch_size or self.config.QUERY_BATCH_SIZE)
+
+    def stream_frames(self, sql: str, params: list, batch_size: Optional[int] = None) -> Iterator[pl.DataFrame]:
+        """Execute a query and stream its result as Polars DataFrames (one per record batch)"""
+        for batch in self.stream(sql, params, batch_size):
+            yield pl.from_arrow(batch)
+
+    def sales_batches(self, start_date: DateLike, end_date: DateLike, batch_size: Optional[int] = None,
+                      **kwargs) -> pa.RecordBatchReader:
+        """Stream sales lines of a date range as Arrow record batches (arguments of `sales_query`)"""
+        return self.stream(*self.sales_query(start_date, end_date, **kwargs), batch_size)
+
+    def sales_frames(self, start_date: DateLike, end_date: DateLike, batch_size: Optional[int] = None,
+                     **kwargs) -> Iterator[pl.DataFrame]:
+        """Stream sales lines of a date range as Polars DataFrames (arguments of `sales_query`)"""
+        return self.stream_frames(*self.sales_query(start_date, end_date, **kwargs), batch_size)
+
+    def sales_summary(self, by: str, start_date: DateLike, end_date: DateLike, **kwargs) -> pl.DataFrame:
+        """Sales summary of a date range as one Polars DataFrame (arguments of `summary_query`)"""
+        self.connect()
+        sql, params = self.summary_query(by, start_date, end_date, **kwargs)
+        return self.connection.execute(sql, params).pl()